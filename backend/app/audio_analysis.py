@@ -0,0 +1,169 @@
+"""Audio features computed locally from decoded audio.
+
+Produces the same columns Spotify's audio-features endpoint returns (and
+MusicRecommender clusters on), on the same scales, so uploaded files can be
+clustered alongside Spotify tracks. The values are signal-level estimates
+(beat periodicity, spectral shape, a key profile match), not a reproduction
+of Spotify's models. Kept free of web-framework imports so it can run in
+pool workers.
+"""
+import os
+import subprocess
+import wave
+from typing import Any, Dict
+import numpy as np
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+# Seconds ffmpeg may spend decoding one file before it is killed
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "120"))
+
+SAMPLE_RATE = 22050
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+# Frames transformed per FFT call, bounding the size of the spectrum block
+FRAMES_PER_BLOCK = 1024
+
+# Krumhansl-Schmuckler key profiles, starting at C
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+def _read_wav(path: str) -> np.ndarray:
+    with wave.open(path) as f:
+        n_channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        raw = f.readframes(f.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width in (2, 4):
+        dtype = np.int16 if width == 2 else np.int32
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    samples = samples.reshape(-1, n_channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        duration = len(samples) / rate
+        grid = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        samples = np.interp(grid, np.arange(len(samples)) / rate, samples).astype(np.float32)
+    return samples
+
+def decode_audio(path: str) -> np.ndarray:
+    """Decode a file to mono float32 samples at SAMPLE_RATE.
+
+    WAV is read with the standard library; anything else (MP3) is decoded
+    by an ffmpeg subprocess.
+    """
+    if path.lower().endswith(".wav"):
+        return _read_wav(path)
+    try:
+        result = subprocess.run(
+            [FFMPEG_BIN, "-nostdin", "-v", "error", "-i", path,
+             "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+            capture_output=True, check=True, timeout=FFMPEG_TIMEOUT
+        )
+    except FileNotFoundError:
+        raise RuntimeError(f"{FFMPEG_BIN} is required to decode {os.path.basename(path)}")
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Could not decode audio: {e.stderr.decode(errors='replace').strip()}")
+    except subprocess.TimeoutExpired:
+        raise ValueError(f"Could not decode audio within {FFMPEG_TIMEOUT:g} seconds")
+    return np.frombuffer(result.stdout, dtype="<f4")
+
+def _estimate_tempo(onsets: np.ndarray):
+    """Tempo (BPM) and beat strength from the autocorrelation of the onset envelope"""
+    onsets = onsets - onsets.mean()
+    n = len(onsets)
+    spectrum = np.fft.rfft(onsets, 2 * n)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    if n < 2 or autocorr[0] <= 0:
+        return 0.0, 0.0
+    frames_per_minute = 60 * SAMPLE_RATE / HOP_SIZE
+    # Search 60-200 BPM
+    min_lag = int(frames_per_minute / 200)
+    max_lag = min(n - 2, int(np.ceil(frames_per_minute / 60)))
+    if max_lag <= min_lag:
+        return 0.0, 0.0
+    # A log-normal prior around 120 BPM settles octave ambiguity (60 vs 120 vs 240)
+    lags = np.arange(min_lag, max_lag + 1)
+    prior = np.exp(-0.5 * np.log2(frames_per_minute / lags / 120) ** 2)
+    lag = min_lag + int(np.argmax(autocorr[min_lag:max_lag + 1] * prior))
+    # Parabolic interpolation around the peak for sub-frame resolution
+    left, peak, right = autocorr[lag - 1], autocorr[lag], autocorr[lag + 1]
+    curvature = left - 2 * peak + right
+    offset = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+    return float(frames_per_minute / (lag + offset)), float(peak / autocorr[0])
+
+def _estimate_key(chroma: np.ndarray):
+    """Key (pitch class, C = 0) and mode (1 major, 0 minor) by profile correlation"""
+    rotations = np.arange(12)
+    major = np.stack([np.roll(MAJOR_PROFILE, k) for k in rotations])
+    minor = np.stack([np.roll(MINOR_PROFILE, k) for k in rotations])
+    profiles = np.vstack([major, minor])
+    profiles = (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+    centered = (chroma - chroma.mean()) / (chroma.std() or 1)
+    scores = profiles @ centered
+    best = int(np.argmax(scores))
+    return best % 12, int(best < 12)
+
+def compute_features(samples: np.ndarray) -> Dict[str, float]:
+    """Audio features from mono samples at SAMPLE_RATE"""
+    samples = np.asarray(samples, dtype=np.float32)
+    n_samples = len(samples)
+    if n_samples < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - len(samples)))
+    # Overlapping frames as a strided view over the samples: no copy
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    n_frames = len(frames)
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    freqs = np.fft.rfftfreq(FRAME_SIZE, 1 / SAMPLE_RATE)
+
+    rms = np.empty(n_frames, dtype=np.float32)
+    centroid = np.empty(n_frames, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+    flux = np.empty(n_frames, dtype=np.float32)
+    total_spectrum = np.zeros(len(freqs))
+    previous = None
+    for start in range(0, n_frames, FRAMES_PER_BLOCK):
+        block = frames[start:start + FRAMES_PER_BLOCK]
+        end = start + len(block)
+        rms[start:end] = np.sqrt(np.mean(block * block, axis=1))
+        magnitude = np.abs(np.fft.rfft(block * window, axis=1)).astype(np.float32)
+        power = magnitude * magnitude + 1e-12
+        total_spectrum += magnitude.sum(axis=0)
+        centroid[start:end] = (magnitude @ freqs) / (magnitude.sum(axis=1) + 1e-12)
+        flatness[start:end] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        # Half-wave rectified spectral flux of log magnitudes drives onset detection
+        log_magnitude = np.log1p(100 * magnitude)
+        previous = log_magnitude[:1] if previous is None else previous
+        flux[start:end] = np.maximum(np.diff(np.vstack([previous, log_magnitude]), axis=0), 0).sum(axis=1)
+        previous = log_magnitude[-1:]
+
+    tempo, beat_strength = _estimate_tempo(flux)
+    pitched = (freqs >= 55) & (freqs <= 5000)
+    pitch_classes = np.round(69 + 12 * np.log2(freqs[pitched] / 440)).astype(int) % 12
+    chroma = np.bincount(pitch_classes, weights=total_spectrum[pitched], minlength=12)
+    key, mode = _estimate_key(chroma)
+
+    overall_rms = float(np.sqrt(np.mean(samples.astype(np.float64) ** 2)))
+    loudness = float(np.clip(20 * np.log10(overall_rms + 1e-10), -60, 0))
+    frame_db = 20 * np.log10(rms + 1e-10)
+    brightness = float(np.clip(np.mean(centroid) / 4000, 0, 1))
+    noisiness = float(np.clip(np.mean(flatness) * 3, 0, 1))
+    loudness_norm = (loudness + 60) / 60
+    danceability = float(np.clip(beat_strength * 2, 0, 1))
+    return {
+        "danceability": danceability,
+        "energy": float(np.clip(0.7 * loudness_norm + 0.3 * brightness, 0, 1)),
+        "key": key,
+        "loudness": loudness,
+        "mode": mode,
+        "speechiness": noisiness,
+        "acousticness": 1 - brightness,
+        "instrumentalness": 1 - noisiness,
+        "liveness": float(np.clip(np.std(frame_db[frame_db > -60]) / 20, 0, 1)) if np.any(frame_db > -60) else 0.0,
+        "valence": float(np.clip(0.4 * mode + 0.3 * brightness + 0.3 * danceability, 0, 1)),
+        "tempo": tempo,
+        "duration_ms": int(1000 * n_samples / SAMPLE_RATE),
+    }
+
+def extract_features(path: str) -> Dict[str, Any]:
+    """Decode an audio file and compute its features (runs in a pool worker)"""
+    return compute_features(decode_audio(path))
@@ -1,10 +1,18 @@
+from __future__ import annotations
 from fastapi import APIRouter, HTTPException, Depends
-import requests
-import pandas as pd
-from typing import List, Dict, Any
+import asyncio
+import httpx
+import operator
+import numpy as np
+from typing import List, Dict, Any, AsyncIterator, Optional
 from datetime import datetime, timedelta
-from .spotify_auth import get_spotify_headers, SPOTIFY_API_BASE_URL, get_spotify_api_client
-from spotipy import Spotify
+from .spotify_auth import get_spotify_api_client
+from .spotify_client import SpotifyClient, SpotifyAPIError
+from .feature_store import feature_store
+from .metrics import operation_duration
+from .lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
 
 router = APIRouter()
 
@@ -15,40 +23,39 @@ class AnalyzeUserData:
     async def get_top_tracks(self, user_id: str, time_range: str = "medium_term", limit: int = 20) -> List[Dict[str, Any]]:
         """Get user's top tracks"""
         try:
-            tracks = self.sp.current_user_top_tracks(time_range=time_range, limit=limit)
-            return tracks["items"]
+            tracks = await self.sp.get_top_tracks(time_range=time_range, limit=limit)
+            return tracks
         except Exception as e:
             raise Exception(f"Error getting top tracks: {str(e)}")
 
     async def get_top_artists(self, user_id: str, time_range: str = "medium_term", limit: int = 20) -> List[Dict[str, Any]]:
         """Get user's top artists"""
         try:
-            artists = self.sp.current_user_top_artists(time_range=time_range, limit=limit)
-            return artists["items"]
+            artists = await self.sp.get_top_artists(time_range=time_range, limit=limit)
+            return artists
         except Exception as e:
             raise Exception(f"Error getting top artists: {str(e)}")
 
     async def get_audio_features(self, track_ids: List[str]) -> List[Dict[str, Any]]:
         """Get audio features for tracks"""
         try:
-            features = self.sp.audio_features(track_ids)
-            return features
+            features = await feature_store.get_many(track_ids, self.sp.get_audio_features_by_id)
+            return [features.get(track_id) for track_id in track_ids]
         except Exception as e:
             raise Exception(f"Error getting audio features: {str(e)}")
 
     async def get_recently_played(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's recently played tracks"""
         try:
-            recent = self.sp.current_user_recently_played(limit=limit)
-            return recent["items"]
+            recent = await self.sp.get_recently_played(limit=limit)
+            return recent
         except Exception as e:
             raise Exception(f"Error getting recently played: {str(e)}")
 
     async def get_playlists(self) -> List[Dict[str, Any]]:
         """Get user's playlists"""
         try:
-            playlists = self.sp.current_user_playlists()
-            return playlists["items"]
+            return [playlist async for playlist in stream_playlists(self.sp)]
         except Exception as e:
             raise Exception(f"Error getting playlists: {str(e)}")
 
@@ -61,68 +68,123 @@ analyze_user_data = AnalyzeUserData()
 
 async def get_user_top_tracks(access_token: str, time_range: str = "medium_term", limit: int = 50) -> List[Dict[str, Any]]:
     """Fetch user's top tracks from Spotify"""
-    headers = get_spotify_headers(access_token)
-    response = requests.get(
-        f"{SPOTIFY_API_BASE_URL}/me/top/tracks",
-        headers=headers,
-        params={"time_range": time_range, "limit": limit}
-    )
-    response.raise_for_status()
-    return response.json()["items"]
+    return await SpotifyClient(access_token).get_top_tracks(time_range=time_range, limit=limit)
 
 async def get_track_features(access_token: str, track_ids: List[str]) -> List[Dict[str, Any]]:
-    """Fetch audio features for multiple tracks"""
-    headers = get_spotify_headers(access_token)
-    response = requests.get(
-        f"{SPOTIFY_API_BASE_URL}/audio-features",
-        headers=headers,
-        params={"ids": ",".join(track_ids)}
-    )
-    response.raise_for_status()
-    return response.json()["audio_features"]
+    """Fetch audio features for multiple tracks, consulting the feature store first"""
+    features = await feature_store.get_many(track_ids, SpotifyClient(access_token).get_audio_features_by_id)
+    return [features.get(track_id) for track_id in track_ids]
 
 async def get_recently_played(access_token: str, limit: int = 50) -> List[Dict[str, Any]]:
     """Fetch user's recently played tracks"""
-    headers = get_spotify_headers(access_token)
-    response = requests.get(
-        f"{SPOTIFY_API_BASE_URL}/me/player/recently-played",
-        headers=headers,
-        params={"limit": limit}
-    )
-    response.raise_for_status()
-    return response.json()["items"]
+    return await SpotifyClient(access_token).get_recently_played(limit=limit)
+
+async def iter_pages(sp: SpotifyClient, path: str, params: Optional[Dict[str, Any]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield each page of a Spotify paging object, following `next` cursors.
+
+    The next page is requested as soon as the current one arrives, so the
+    consumer's work on one page overlaps with the round trip for the next.
+    """
+    pending = asyncio.ensure_future(sp.get(path, params))
+    try:
+        while pending is not None:
+            page = await pending
+            next_url = page.get("next")
+            pending = asyncio.ensure_future(sp.get(next_url)) if next_url else None
+            yield page["items"]
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+async def iter_items(sp: SpotifyClient, path: str, params: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the items of every page of a Spotify paging object"""
+    async for items in iter_pages(sp, path, params):
+        for item in items:
+            yield item
+
+async def stream_saved_tracks(sp: SpotifyClient, page_size: int = 50) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every track in the user's library"""
+    async for item in iter_items(sp, "/me/tracks", {"limit": page_size}):
+        if item.get("track"):
+            yield item["track"]
+
+async def stream_playlists(sp: SpotifyClient, page_size: int = 50) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every playlist the user owns or follows"""
+    async for playlist in iter_items(sp, "/me/playlists", {"limit": page_size}):
+        yield playlist
+
+async def stream_playlist_tracks(sp: SpotifyClient, playlist_id: str, page_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every track of a playlist, skipping local files and removed tracks"""
+    async for item in iter_items(sp, f"/playlists/{playlist_id}/tracks", {"limit": page_size}):
+        track = item.get("track")
+        if track and track.get("id") and not item.get("is_local"):
+            yield track
+
+async def enrich_with_features(
+    sp: SpotifyClient,
+    tracks: AsyncIterator[Dict[str, Any]],
+    batch_size: int = 100
+) -> AsyncIterator[Dict[str, Any]]:
+    """Attach audio features to a track stream, one feature lookup per batch of tracks"""
+    batch: List[Dict[str, Any]] = []
+
+    async def flush() -> List[Dict[str, Any]]:
+        with operation_duration.time("enrich_with_features"):
+            features = await feature_store.get_many([t["id"] for t in batch], sp.get_audio_features_by_id)
+        for track in batch:
+            if track["id"] in features:
+                track["audio_features"] = features[track["id"]]
+        return batch
+
+    async for track in tracks:
+        batch.append(track)
+        if len(batch) >= batch_size:
+            for enriched in await flush():
+                yield enriched
+            batch = []
+    if batch:
+        for enriched in await flush():
+            yield enriched
+
+# Audio feature columns and their storage types in processed track frames
+FEATURE_COLUMNS = [
+    "danceability", "energy", "key", "loudness", "mode",
+    "speechiness", "acousticness", "instrumentalness",
+    "liveness", "valence", "tempo"
+]
+INTEGER_FEATURES = {"key", "mode"}
 
 def process_track_data(tracks: List[Dict[str, Any]], features: List[Dict[str, Any]]) -> pd.DataFrame:
-    """Process track data and audio features into a DataFrame"""
+    """Process track data and audio features into a DataFrame.
+
+    Columns are built directly as typed NumPy arrays (float32 features, int8
+    key/mode) rather than through a dict per track.
+    """
     # Create a dictionary to map track IDs to their features
     features_dict = {f["id"]: f for f in features if f is not None}
-    
-    # Process tracks and combine with features
-    processed_data = []
-    for track in tracks:
-        track_id = track["id"]
-        if track_id in features_dict:
-            track_data = {
-                "id": track_id,
-                "name": track["name"],
-                "artist": track["artists"][0]["name"],
-                "popularity": track["popularity"],
-                "duration_ms": track["duration_ms"],
-                "danceability": features_dict[track_id]["danceability"],
-                "energy": features_dict[track_id]["energy"],
-                "key": features_dict[track_id]["key"],
-                "loudness": features_dict[track_id]["loudness"],
-                "mode": features_dict[track_id]["mode"],
-                "speechiness": features_dict[track_id]["speechiness"],
-                "acousticness": features_dict[track_id]["acousticness"],
-                "instrumentalness": features_dict[track_id]["instrumentalness"],
-                "liveness": features_dict[track_id]["liveness"],
-                "valence": features_dict[track_id]["valence"],
-                "tempo": features_dict[track_id]["tempo"]
-            }
-            processed_data.append(track_data)
-    
-    return pd.DataFrame(processed_data)
+    matched = [track for track in tracks if track["id"] in features_dict]
+    matched_features = [features_dict[track["id"]] for track in matched]
+    n = len(matched)
+
+    # One C-level lookup per track pulls all feature values into a matrix row
+    # (building float64 and casting once is faster than a float32 build)
+    matrix = np.array(
+        list(map(operator.itemgetter(*FEATURE_COLUMNS), matched_features)),
+        dtype=np.float64
+    ).reshape(n, len(FEATURE_COLUMNS))
+
+    columns = {
+        "id": [track["id"] for track in matched],
+        "name": [track["name"] for track in matched],
+        "artist": [track["artists"][0]["name"] for track in matched],
+        "popularity": np.fromiter(map(operator.itemgetter("popularity"), matched), dtype=np.int16, count=n),
+        "duration_ms": np.fromiter(map(operator.itemgetter("duration_ms"), matched), dtype=np.int32, count=n),
+    }
+    for i, column in enumerate(FEATURE_COLUMNS):
+        dtype = np.int8 if column in INTEGER_FEATURES else np.float32
+        columns[column] = matrix[:, i].astype(dtype)
+
+    return pd.DataFrame(columns)
 
 @router.get("/user/top-tracks")
 async def get_user_top_tracks_endpoint(access_token: str, time_range: str = "medium_term"):
@@ -139,7 +201,7 @@ async def get_user_top_tracks_endpoint(access_token: str, time_range: str = "med
         df = process_track_data(tracks, features)
         return df.to_dict(orient="records")
         
-    except requests.exceptions.RequestException as e:
+    except (SpotifyAPIError, httpx.HTTPError) as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/user/recently-played")
@@ -157,5 +219,5 @@ async def get_recently_played_endpoint(access_token: str):
         df = process_track_data([item["track"] for item in recent_tracks], features)
         return df.to_dict(orient="records")
         
-    except requests.exceptions.RequestException as e:
+    except (SpotifyAPIError, httpx.HTTPError) as e:
         raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
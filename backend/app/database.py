@@ -0,0 +1,63 @@
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+import os
+import threading
+from typing import Any, Dict, List, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Defaults to a local SQLite file so caches work without a database server
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./spotify_analyzer.db")
+
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, connect_args=connect_args, pool_pre_ping=True)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
+
+_init_lock = threading.Lock()
+_initialized = False
+
+def init_db():
+    """Create any tables that do not exist yet"""
+    Base.metadata.create_all(bind=engine)
+
+def ensure_db():
+    """Run init_db once per process, however many threads ask at the same time"""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        try:
+            init_db()
+        except SQLAlchemyError:
+            # Another worker process created a table between the check and the CREATE
+            init_db()
+        _initialized = True
+
+def upsert(session: Session, model, rows: List[Dict[str, Any]], update_columns: Sequence[str] = ()):
+    """Insert rows in one statement; rows whose primary key exists get update_columns, or are left alone without any"""
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for row in rows:
+            session.merge(model(**row))
+        return
+    keys = [column.name for column in model.__table__.primary_key]
+    statement = insert(model).values(rows)
+    if update_columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=keys, set_={column: statement.excluded[column] for column in update_columns}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=keys)
+    session.execute(statement)
@@ -0,0 +1,97 @@
+"""Compact on-disk feature matrices that open as memory maps.
+
+A file is an 8-byte magic, a little-endian uint64 header length, a JSON
+header and then the array blocks, each 64-byte aligned. The header records
+every block's dtype, shape and offset plus free-form metadata, so readers
+map the blocks straight from the page cache without parsing or copying.
+"""
+import json
+import os
+import struct
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+MAGIC = b"SPFEAT01"
+ALIGNMENT = 64
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write_feature_file(path: str, blocks: Dict[str, np.ndarray], metadata: Dict[str, Any]):
+    """Write named arrays and metadata, atomically replacing any existing file"""
+    layout, offset = {}, 0
+    for name, array in blocks.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({"blocks": layout, "metadata": metadata}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in blocks.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+def open_feature_file(path: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Map every block of a feature file read-only"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a feature file")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length))
+    data_start = _align(len(MAGIC) + 8 + header_length)
+
+    blocks = {}
+    for name, block in header["blocks"].items():
+        shape = tuple(block["shape"])
+        if 0 in shape:
+            # np.memmap cannot map an empty region
+            blocks[name] = np.empty(shape, dtype=np.dtype(block["dtype"]))
+            continue
+        blocks[name] = np.memmap(
+            path, dtype=np.dtype(block["dtype"]), mode="r",
+            offset=data_start + block["offset"], shape=shape
+        )
+    return blocks, header["metadata"]
+
+class SortedIds:
+    """Read-only ID -> row mapping backed by a sorted ID array.
+
+    Lookups are a binary search, so the mapping can live in a memory map
+    instead of a per-process dict.
+    """
+    def __init__(self, sorted_ids: np.ndarray, rows: np.ndarray):
+        self.sorted_ids = sorted_ids
+        self.rows = rows
+
+    @classmethod
+    def build(cls, ids: np.ndarray) -> "SortedIds":
+        order = np.argsort(ids, kind="stable")
+        return cls(ids[order], order)
+
+    def __len__(self) -> int:
+        return len(self.sorted_ids)
+
+    def get(self, track_id: str, default: Optional[int] = None) -> Optional[int]:
+        key = track_id.encode()
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < len(self.sorted_ids) and self.sorted_ids[i] == key:
+            return int(self.rows[i])
+        return default
+
+    def __getitem__(self, track_id: str) -> int:
+        row = self.get(track_id)
+        if row is None:
+            raise KeyError(track_id)
+        return row
+
+    def __contains__(self, track_id: str) -> bool:
+        return self.get(track_id) is not None
+
+    def keys(self):
+        return [track_id.decode() for track_id in self.sorted_ids.tolist()]
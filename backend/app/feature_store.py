@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+from sqlalchemy import Column, DateTime, JSON, String, select
+from .cache import TTLCache
+from .database import Base, SessionLocal, ensure_db, upsert
+
+logger = logging.getLogger(__name__)
+
+# Hot track features kept in memory in front of the database table
+FEATURE_CACHE_SIZE = int(os.getenv("FEATURE_CACHE_SIZE", "50000"))
+
+class AudioFeaturesRecord(Base):
+    __tablename__ = "audio_features"
+
+    track_id = Column(String(64), primary_key=True)
+    features = Column(JSON, nullable=False)
+    fetched_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+FeatureFetcher = Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]]
+
+class AudioFeatureStore:
+    """Cross-user audio features store: memory LRU -> database -> Spotify"""
+    def __init__(self, memory_size: int = FEATURE_CACHE_SIZE):
+        # Audio features never change, so entries only leave memory via LRU
+        self.memory = TTLCache(max_size=memory_size, ttl=float("inf"))
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.upstream_fetches = 0
+
+    def _load_from_db(self, track_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        ensure_db()
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(AudioFeaturesRecord.track_id, AudioFeaturesRecord.features)
+                .where(AudioFeaturesRecord.track_id.in_(track_ids))
+            )
+            return {track_id: features for track_id, features in rows}
+
+    def _save_to_db(self, features: Dict[str, Dict[str, Any]]):
+        ensure_db()
+        # Features never change, so a row another request stored first is kept
+        rows = [{"track_id": track_id, "features": feature} for track_id, feature in features.items()]
+        with SessionLocal() as session:
+            upsert(session, AudioFeaturesRecord, rows)
+            session.commit()
+
+    async def get_many(self, track_ids: List[str], fetch: FeatureFetcher) -> Dict[str, Dict[str, Any]]:
+        """Return features keyed by track ID, fetching only unknown IDs with fetch (which returns them keyed by ID)"""
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for track_id in dict.fromkeys(track_ids):
+            if not track_id:
+                continue
+            feature = self.memory.get(track_id)
+            if feature is None:
+                missing.append(track_id)
+            else:
+                found[track_id] = feature
+        self.memory_hits += len(found)
+
+        if missing:
+            try:
+                stored = await asyncio.to_thread(self._load_from_db, missing)
+            except Exception as e:
+                logger.error(f"Error reading audio features store: {str(e)}")
+                stored = {}
+            self.db_hits += len(stored)
+            for track_id, feature in stored.items():
+                self.memory.set(track_id, feature)
+            found.update(stored)
+            missing = [track_id for track_id in missing if track_id not in stored]
+
+        if missing:
+            self.upstream_fetches += len(missing)
+            fetched = await fetch(missing)
+            for track_id, feature in fetched.items():
+                self.memory.set(track_id, feature)
+            found.update(fetched)
+            if fetched:
+                try:
+                    await asyncio.to_thread(self._save_to_db, fetched)
+                except Exception as e:
+                    logger.error(f"Error writing audio features store: {str(e)}")
+
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.db_hits + self.upstream_fetches
+        return {
+            "memory_size": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.upstream_fetches,
+            "hit_ratio": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+        }
+
+feature_store = AudioFeatureStore()
@@ -0,0 +1,104 @@
+"""Deferred imports of the heavy numeric stack.
+
+pandas, scikit-learn, joblib and spotipy take a couple of seconds to import
+between them, while most requests (auth, cached analytics) never touch them.
+Modules bind them with lazy_import so the API process starts without them;
+warm_up imports them in a background thread once the server is serving, so
+the first request that needs one rarely pays for it.
+
+Run ``python -m app.lazy_imports`` from the backend directory for a report of
+what importing app.main costs, module by module.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Warm the heavy imports in the background this many seconds after startup (<0 disables)
+IMPORT_WARMUP_DELAY = float(os.getenv("IMPORT_WARMUP_DELAY", "1"))
+
+HEAVY_MODULES = ["pandas", "sklearn.cluster", "sklearn.metrics", "sklearn.preprocessing", "joblib", "spotipy.oauth2"]
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access"""
+    def __init__(self, name: str):
+        self.__name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        value = getattr(importlib.import_module(self.__name), attribute)
+        # Later lookups of this attribute no longer go through __getattr__
+        setattr(self, attribute, value)
+        return value
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self.__name!r}>"
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+def _import_all(modules: List[str]) -> Dict[str, float]:
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+async def warm_up(modules: List[str] = HEAVY_MODULES, delay: float = IMPORT_WARMUP_DELAY):
+    """Import modules off the event loop once startup has finished"""
+    await asyncio.sleep(delay)
+    try:
+        timings = await asyncio.to_thread(_import_all, modules)
+    except Exception as e:
+        logger.error(f"Error warming up imports: {str(e)}")
+        return
+    logger.info("Warmed up imports: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+
+def import_report(module: str = "app.main") -> List[Dict[str, Any]]:
+    """Per-module import cost of a fresh `import module`, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    pattern = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = pattern.match(line)
+        if match:
+            rows.append({
+                "module": match.group(4),
+                "self_ms": int(match.group(1)) / 1000,
+                "cumulative_ms": int(match.group(2)) / 1000,
+                "depth": (len(match.group(3)) - 1) // 2,
+            })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Report what importing the API costs, module by module")
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=25, help="how many modules to list")
+    parser.add_argument("--depth", type=int, help="only list modules imported at most this deep")
+    args = parser.parse_args()
+
+    rows = import_report(args.module)
+    total = next((row["cumulative_ms"] for row in rows if row["module"] == args.module), 0.0)
+    heavy = {name.split(".")[0] for name in HEAVY_MODULES}
+    loaded = sorted({row["module"].split(".")[0] for row in rows} & heavy)
+    if args.depth is not None:
+        rows = [row for row in rows if row["depth"] <= args.depth]
+    print(f"import {args.module}: {total:.0f} ms")
+    print(f"heavy modules imported eagerly: {', '.join(loaded) or 'none'}\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for row in sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"{row['cumulative_ms']:>14.1f} {row['self_ms']:>9.1f}  {'  ' * row['depth']}{row['module']}")
+
+if __name__ == "__main__":
+    main()
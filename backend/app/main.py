@@ -1,14 +1,45 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 from .routers import analysis, recommendations, upload
-from .spotify_auth import router as spotify_router
+from .spotify_auth import router as spotify_router, user_cache
+from .ml_model import router as ml_router, registry
+from .ml_jobs import job_manager
+from .feature_store import feature_store
+from .snapshots import snapshot_service
+from .rate_limiter import scheduler
+from .spotify_client import open_http_client, close_http_client, get_pool_stats
+from .responses import FastJSONResponse
+from .lazy_imports import IMPORT_WARMUP_DELAY, warm_up
+from .metrics import CONTENT_TYPE, MetricsMiddleware, event_loop_monitor, register_caches, registry as metrics_registry
 import os
 from dotenv import load_dotenv
+from brotli_asgi import BrotliMiddleware
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive connection pool for all Spotify traffic
+    await open_http_client()
+    snapshot_service.start()
+    event_loop_monitor.start()
+    # pandas/scikit-learn load after startup instead of delaying it
+    warm_up_task = asyncio.create_task(warm_up()) if IMPORT_WARMUP_DELAY >= 0 else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await event_loop_monitor.stop()
+    await snapshot_service.stop()
+    await close_http_client()
+    job_manager.shutdown()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -19,11 +50,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses with brotli when the client accepts it, gzip otherwise
+app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+
+# Outermost, so request timings include CORS and compression
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(spotify_router, prefix="/spotify", tags=["spotify"])
 app.include_router(analysis.router)
 app.include_router(recommendations.router)
 app.include_router(upload.router, prefix="/upload", tags=["upload"])
+app.include_router(ml_router, prefix="/ml", tags=["ml"])
 @app.get("/")
 async def root():
     return {"message": "Spotify Analyzer API"}
@@ -32,6 +70,52 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/http-pool")
+async def http_pool_stats():
+    """Connection pool utilisation for sizing SPOTIFY_HTTP_* limits"""
+    return get_pool_stats()
+
+@app.get("/health/rate-limits")
+async def rate_limit_stats():
+    """Queue depth and throttling of outbound Spotify requests"""
+    return scheduler.stats()
+
+@app.get("/health/caches")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return {
+        "user_profiles": user_cache.stats(),
+        "audio_features": feature_store.stats(),
+        "models": registry.models.stats(),
+        "analytics_snapshots": snapshot_service.stats(),
+        "similar_tracks": recommendations.similar_tracks_cache.stats(),
+    }
+
+def cache_counters():
+    features = feature_store.stats()
+    caches = {
+        "user_profiles": user_cache,
+        "models": registry.models,
+        "analytics_snapshots": snapshot_service.memory,
+        "similar_tracks": recommendations.similar_tracks_cache,
+        "playlist_names": upload.playlist_cache,
+    }
+    counters = {name: (cache.hits, cache.misses) for name, cache in caches.items()}
+    counters["audio_features"] = (features["memory_hits"] + features["db_hits"], features["misses"])
+    return counters
+
+register_caches(cache_counters)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/ml-jobs")
+async def ml_job_stats():
+    """Process pool size and job counts by status"""
+    return job_manager.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
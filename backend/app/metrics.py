@@ -0,0 +1,281 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are plain Python numbers updated under a lock, so
+recording costs on the order of a microsecond; GET /metrics renders them. Values
+that other components already count, such as cache hits, are read
+through callbacks at scrape time instead of being duplicated. Metrics are
+per process: work done inside ML pool workers is timed from the event loop.
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How often the event loop lag probe wakes up (seconds)
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+OPERATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Starlette appends the charset to text responses
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """(name suffix, label names, label values, value) for every series"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    """Monotonically increasing count per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("", self.labelnames, labels, value) for labels, value in items]
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram of observations per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        samples = []
+        names = self.labelnames + ("le",)
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append(("_bucket", names, labels + (_format_value(bound),), cumulative))
+            samples.append(("_sum", self.labelnames, labels, total))
+            samples.append(("_count", self.labelnames, labels, count))
+        return samples
+
+class CallbackMetric(Metric):
+    """Series read at scrape time from a function returning {label values: value}"""
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], kind: str, collect: Callable[[], Dict[Labels, float]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        return [("", self.labelnames, labels, value) for labels, value in self.collect().items()]
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests, by route template",
+    ("method", "route")
+))
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests handled, by route template and status", ("method", "route", "status")
+))
+spotify_request_duration = registry.register(Histogram(
+    "spotify_request_duration_seconds", "Latency of individual Spotify API attempts, by endpoint",
+    ("method", "endpoint")
+))
+spotify_requests = registry.register(Counter(
+    "spotify_requests_total", "Spotify API attempts, by endpoint and response status", ("method", "endpoint", "status")
+))
+operation_duration = registry.register(Histogram(
+    "operation_duration_seconds", "Time spent in data processing and model operations",
+    ("operation",), OPERATION_BUCKETS
+))
+ml_job_duration = registry.register(Histogram(
+    "ml_job_duration_seconds", "ML pool jobs from submission to completion, by kind and outcome",
+    ("kind", "status"), OPERATION_BUCKETS
+))
+event_loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a sleeping task", (), LAG_BUCKETS
+))
+
+def timed(operation: str):
+    """Record a function's run time under operation_duration_seconds"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with operation_duration.time(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def register_caches(caches: Callable[[], Dict[str, Tuple[int, int]]]):
+    """Expose cache hits, misses and hit ratio from a {cache: (hits, misses)} callback"""
+    def ratios():
+        return {(name,): hits / (hits + misses) if hits + misses else 0.0 for name, (hits, misses) in caches().items()}
+    registry.register(CallbackMetric(
+        "cache_hits_total", "Cache lookups answered from the cache", ("cache",), "counter",
+        lambda: {(name,): hits for name, (hits, _) in caches().items()}
+    ))
+    registry.register(CallbackMetric(
+        "cache_misses_total", "Cache lookups that had to load the value", ("cache",), "counter",
+        lambda: {(name,): misses for name, (_, misses) in caches().items()}
+    ))
+    registry.register(CallbackMetric("cache_hit_ratio", "Hits over lookups since start", ("cache",), "gauge", ratios))
+
+# Path segments kept verbatim in endpoint labels; anything else is an ID
+SPOTIFY_PATH_WORDS = {
+    "v1", "api", "token", "me", "top", "tracks", "artists", "albums", "playlists", "users",
+    "player", "recently-played", "audio-features", "audio-analysis", "recommendations", "search",
+}
+
+@functools.lru_cache(maxsize=1024)
+def spotify_endpoint(path: str) -> str:
+    """Low-cardinality label for a Spotify URL path, e.g. /v1/tracks/{id}"""
+    segments = [segment if segment in SPOTIFY_PATH_WORDS else "{id}" for segment in path.strip("/").split("/")]
+    return "/" + "/".join(segments)
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template"""
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Any, str] = {}
+
+    def route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self._routes.get(endpoint)
+        if label is None:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    label = route.path
+                    break
+            label = self._routes[endpoint] = label or getattr(endpoint, "__name__", "unknown")
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self.route_label(scope)
+            http_request_duration.observe(time.perf_counter() - start, scope["method"], route)
+            http_requests.inc(scope["method"], route, str(status))
+
+class EventLoopLagMonitor:
+    """Background task measuring how far behind schedule the event loop wakes up"""
+    def __init__(self, interval: float = EVENT_LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        registry.register(CallbackMetric(
+            "event_loop_lag_last_seconds", "Most recent event loop lag sample", (), "gauge",
+            lambda: {(): self.last_lag}
+        ))
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - start - self.interval)
+            event_loop_lag.observe(self.last_lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+event_loop_monitor = EventLoopLagMonitor()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from .cache import TTLCache
+from .metrics import ml_job_duration
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for model training and scoring, and how long finished jobs stay pollable
+ML_WORKERS = int(os.getenv("ML_WORKERS", str(os.cpu_count() or 1)))
+ML_JOB_TTL = float(os.getenv("ML_JOB_TTL", "3600"))
+
+class Job:
+    """A unit of model work running in the process pool"""
+    def __init__(self, user_id: str, kind: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.future: Optional[Future] = None
+
+    def refresh(self):
+        # The pool does not report when work starts, so observe it on read
+        if self.status == "queued" and self.future is not None and self.future.running():
+            self.status = "running"
+            self.started_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        self.refresh()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """Runs CPU-bound functions in a bounded process pool and tracks them as jobs.
+
+    Pool results are handed to an async on_result callback on the event loop,
+    which produces the job's final result (e.g. installing a trained model).
+    """
+    def __init__(self, max_workers: int = ML_WORKERS):
+        self.max_workers = max_workers
+        self.jobs = TTLCache(max_size=10000, ttl=ML_JOB_TTL)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers avoid forking a process that is running an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def submit(
+        self,
+        user_id: str,
+        kind: str,
+        fn: Callable[..., Any],
+        args: tuple,
+        on_result: Callable[[Any], Awaitable[Any]],
+        cleanup: Optional[Callable[[], None]] = None,
+        prepare: Optional[Callable[[], Awaitable[tuple]]] = None
+    ) -> Job:
+        """Start fn(*args) in the pool and return its job immediately.
+
+        With prepare, the job first awaits it on the event loop and submits
+        fn with the arguments it returns instead of args.
+        """
+        job = Job(user_id, kind)
+        self.jobs.set(job.id, job)
+        job.task = asyncio.create_task(self._run(job, fn, args, on_result, cleanup, prepare))
+        return job
+
+    async def _run(self, job: Job, fn, args, on_result, cleanup, prepare):
+        try:
+            if prepare is not None and job.status == "queued":
+                job.status = "running"
+                job.started_at = time.time()
+                args = await prepare()
+            if job.status == "cancelled":
+                return
+            job.future = self.executor.submit(fn, *args)
+            raw = await asyncio.wrap_future(job.future)
+            job.refresh()
+            if job.status == "cancelled":
+                return
+            job.result = await on_result(raw)
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.error(f"ML job {job.id} ({job.kind}) failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            ml_job_duration.observe(job.finished_at - job.created_at, job.kind, job.status)
+            if cleanup is not None:
+                cleanup()
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(*args) in the pool and wait for its result, without tracking a job"""
+        return await asyncio.wrap_future(self.executor.submit(fn, *args))
+
+    async def map(self, fn: Callable[..., Any], arg_tuples: Iterable[tuple]) -> List[Any]:
+        """Run fn over each argument tuple in parallel across the pool"""
+        futures = [self.executor.submit(fn, *args) for args in arg_tuples]
+        try:
+            return await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def get(self, job_id: str, user_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """Cancel a job. Queued work never starts; running work finishes in its
+        worker but its result is discarded."""
+        job.refresh()
+        if job.status not in ("queued", "running"):
+            return False
+        job.status = "cancelled"
+        if job.future is not None:
+            # Only succeeds while the work is still waiting for a worker
+            job.future.cancel()
+        return True
+
+    async def wait(self, job: Job) -> Job:
+        if job.task is not None:
+            await asyncio.shield(job.task)
+        return job
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            job.refresh()
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"max_workers": self.max_workers, "jobs": statuses}
+
+job_manager = JobManager()
@@ -1,19 +1,79 @@
-from fastapi import APIRouter, HTTPException
+from __future__ import annotations
+from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import copy
+import glob
+import hashlib
+import logging
+import tempfile
+import time
+import uuid
+import weakref
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Any
-import joblib
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 import os
+from pydantic import BaseModel, Field
+from .cache import TTLCache
+from .feature_file import SortedIds, open_feature_file, write_feature_file
+from .lazy_imports import lazy_import
+from .metrics import operation_duration, timed
+from .ml_jobs import Job, job_manager
+from .ml_workers import (
+    fit_clusters, fit_clusters_shared, score_k_shared, share_array,
+    top_k_by_groups, top_k_by_groups_shared
+)
+from .spotify_auth import get_current_user
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are only serialised within a process
+    fcntl = None
+
+if TYPE_CHECKING:
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+# Loaded on first use (or by the startup warm-up), not when the app is imported
+pd = lazy_import("pandas")
+joblib = lazy_import("joblib")
+preprocessing = lazy_import("sklearn.preprocessing")
 
 router = APIRouter()
 
+# Where fitted per-user models live and how many stay loaded in memory
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "32"))
+# Reads of a model whose feature file a concurrent save removed are retried this often
+MODEL_LOAD_ATTEMPTS = 3
+
+# Bounds on one batch recommendation request (seeds, and results per seed)
+ML_BATCH_MAX_SEEDS = int(os.getenv("ML_BATCH_MAX_SEEDS", "100"))
+ML_MAX_RECOMMENDATIONS = int(os.getenv("ML_MAX_RECOMMENDATIONS", "100"))
+
+# Largest seeds x candidates score matrix computed in one batch (float32 cells)
+SCORE_BLOCK_SIZE = 1 << 24
+
+# Candidate cluster counts for automatic selection and the sample they are scored on
+ML_K_MIN = int(os.getenv("ML_K_MIN", "2"))
+ML_K_MAX = int(os.getenv("ML_K_MAX", "12"))
+ML_SELECTION_SAMPLE = int(os.getenv("ML_SELECTION_SAMPLE", "2000"))
+# A chosen k is reused until the library size drifts by more than this fraction
+ML_SELECTION_DRIFT = float(os.getenv("ML_SELECTION_DRIFT", "0.25"))
+
 class MusicRecommender:
+    # Set when the feature columns and index are memory-mapped from a feature file
+    features: Optional[np.ndarray] = None
+    ids: Optional[np.ndarray] = None
+    feature_file: Optional[str] = None
+    integer_columns: List[str] = []
+    
     def __init__(self):
-        self.scaler = StandardScaler()
+        self.scaler = preprocessing.StandardScaler()
         self.model = None
+        self.tracks = None
         self.feature_columns = [
             'danceability', 'energy', 'key', 'loudness', 'mode',
             'speechiness', 'acousticness', 'instrumentalness',
@@ -27,77 +87,762 @@ class MusicRecommender:
         scaled_features = self.scaler.fit_transform(features)
         return scaled_features
     
-    def train_model(self, df: pd.DataFrame, n_clusters: int = 5):
-        """Train the K-means clustering model"""
-        scaled_features = self.preprocess_data(df)
-        self.model = KMeans(n_clusters=n_clusters, random_state=42)
-        self.model.fit(scaled_features)
+    @timed("ml_train")
+    def train_model(self, df: pd.DataFrame, n_clusters: int = 5, warm_start: bool = False):
+        """Train the K-means clustering model.
+
+        With warm_start, an already trained model seeds KMeans with its
+        previous centroids (re-expressed in the new scaling) and runs a single
+        initialisation instead of several random restarts.
+        """
+        scaler, model = fit_clusters(
+            df[self.feature_columns].values,
+            n_clusters,
+            self.warm_start_centers(n_clusters) if warm_start else None
+        )
+        return self.apply_fit(df, scaler, model)
+    
+    def warm_start_centers(self, n_clusters: int) -> Optional[np.ndarray]:
+        """Current centroids in unscaled feature space, if they can seed a refit"""
+        if self.model is None or self.model.n_clusters != n_clusters:
+            return None
+        return self.scaler.inverse_transform(self.model.cluster_centers_)
+    
+    def apply_fit(self, df: pd.DataFrame, scaler: StandardScaler, model: KMeans):
+        """Adopt a fitted scaler and KMeans trained on df"""
+        self.scaler = scaler
+        self.model = model
+        self.features = None
+        self.ids = None
+        self.cluster_counts = np.bincount(model.labels_, minlength=model.n_clusters)
+        # Keep the training tracks so recommendations need no track list
+        self.tracks = df.reset_index(drop=True)
+        self.build_index(scaler.transform(self.tracks[self.feature_columns].values))
         return self.model.labels_
     
-    def get_recommendations(self, df: pd.DataFrame, track_id: str, n_recommendations: int = 5) -> List[Dict[str, Any]]:
-        """Get music recommendations based on a track"""
+    def clone(self) -> "MusicRecommender":
+        """A copy that can be updated or refitted while this one keeps serving.
+
+        Arrays and the track frame are shared, since updates replace them
+        rather than write to them; the scaler, KMeans and an in-memory ID
+        lookup are modified in place, so they are copied.
+        """
+        clone = copy.copy(self)
+        clone.scaler = copy.deepcopy(self.scaler)
+        clone.model = copy.copy(self.model)
+        if isinstance(self.__dict__.get("id_index"), dict):
+            clone.id_index = dict(self.id_index)
+        return clone
+    
+    @timed("ml_update")
+    def update_model(self, df: pd.DataFrame):
+        """Fold new tracks into a trained model without refitting it.
+
+        The scaler is updated with partial_fit, the centroids are moved to the
+        new scaling and then shifted towards the tracks assigned to them by a
+        running-mean (mini-batch KMeans) step. Existing tracks keep their
+        clusters. Tracks already in the model are ignored.
+
+        The similarity index is still rebuilt over every track, and saving
+        rewrites the whole feature file: the new scaling moves every stored
+        row, and cells are contiguous in the file.
+        """
+        if self.model is None:
+            return self.train_model(df)
+        self.materialize()
+        self._ensure_index()
+        
+        new_tracks = df[~df["id"].isin(self.id_index.keys())].drop_duplicates("id")
+        if new_tracks.empty:
+            return self.model.labels_
+        raw_features = new_tracks[self.feature_columns].values
+        
+        # Update the scaling and carry the centroids over to it
+        raw_centers = self.scaler.inverse_transform(self.model.cluster_centers_)
+        self.scaler.partial_fit(raw_features)
+        centers = self.scaler.transform(raw_centers)
+        scaled_new = self.scaler.transform(raw_features)
+        
+        # Assign the new tracks and move each centroid to the running mean
+        distances = ((scaled_new[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1).astype(self.model.labels_.dtype)
+        n_clusters = self.model.n_clusters
+        counts = getattr(self, "cluster_counts", None)
+        if counts is None:
+            counts = np.bincount(self.model.labels_, minlength=n_clusters)
+        batch_counts = np.bincount(new_labels, minlength=n_clusters)
+        batch_sums = np.zeros_like(centers)
+        np.add.at(batch_sums, new_labels, scaled_new)
+        self.cluster_counts = counts + batch_counts
+        centers += (batch_sums - batch_counts[:, None] * centers) / np.maximum(self.cluster_counts, 1)[:, None]
+        
+        self.model.cluster_centers_ = centers
+        self.model.labels_ = np.concatenate([self.model.labels_, new_labels])
+        first_row = len(self.tracks)
+        self.tracks = pd.concat([self.tracks, new_tracks], ignore_index=True)
+        for offset, track_id in enumerate(new_tracks["id"].tolist()):
+            self.id_index[track_id] = first_row + offset
+        self.build_index(self.scaler.transform(self.tracks[self.feature_columns].values), index_ids=False)
+        return self.model.labels_
+    
+    def build_index(self, scaled_features: np.ndarray, index_ids: bool = True):
+        """Precompute an inverted-file index over the KMeans cells.
+
+        Rows are L2-normalised (so cosine similarity is a dot product) and
+        stored grouped by cluster, making each cell one contiguous slice.
+        """
+        norms = np.linalg.norm(scaled_features, axis=1, keepdims=True)
+        normalized = (scaled_features / np.where(norms == 0, 1, norms)).astype(np.float32)
+        labels = self.model.labels_
+        order = np.argsort(labels, kind="stable")
+        self.index_matrix = np.ascontiguousarray(normalized[order])
+        self.index_rows = order
+        self.cell_offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=self.model.n_clusters))))
+        self.row_positions = np.empty_like(order)
+        self.row_positions[order] = np.arange(len(order))
+        if index_ids:
+            self.id_index = {track_id: row for row, track_id in enumerate(self.tracks["id"].tolist())}
+    
+    def feature_matrix(self) -> np.ndarray:
+        """Raw feature values in row order, from the feature file when mapped"""
+        if self.features is not None:
+            return self.features
+        return self.tracks[self.feature_columns].values
+    
+    def attach_features(self, path: str):
+        """Map the feature columns, similarity index and ID lookup from a feature file.
+
+        Rows in the file are stored in cell order, so the index needs no
+        row permutation and the arrays are shared through the page cache.
+        """
+        blocks, metadata = open_feature_file(path)
+        self.features = blocks["features"]
+        self.ids = blocks["ids"]
+        self.integer_columns = metadata["integer_columns"]
+        self.index_matrix = blocks["index"]
+        self.index_rows = np.arange(len(self.index_matrix))
+        self.row_positions = self.index_rows
+        self.cell_offsets = np.array(metadata["cell_offsets"])
+        self.id_index = SortedIds(blocks["sorted_ids"], blocks["sorted_rows"])
+    
+    def materialize(self):
+        """Copy mapped feature columns back into tracks so the model can be modified"""
+        if self.features is None:
+            return
+        features = pd.DataFrame(np.asarray(self.features), columns=self.feature_columns)
+        for column in self.integer_columns:
+            features[column] = features[column].astype(np.int64)
+        ids = pd.Series(np.char.decode(self.ids, "utf-8"), name="id")
+        self.tracks = pd.concat([ids, self.tracks, features], axis=1)
+        self.features = None
+        self.ids = None
+        self.build_index(self.scaler.transform(self.tracks[self.feature_columns].values))
+    
+    def _records(self, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """Track records for the given rows, with feature values from the feature file when mapped"""
+        if self.features is None:
+            return self.tracks.iloc[rows].to_dict('records')
+        if len(rows) == 0:
+            return []
+        # Without metadata columns the saved frame has no columns, and to_dict yields no rows
+        if len(self.tracks.columns):
+            records = self.tracks.iloc[rows].to_dict('records')
+        else:
+            records = [{} for _ in range(len(rows))]
+        records = [
+            {"id": track_id.decode(), **record}
+            for record, track_id in zip(records, self.ids[rows].tolist())
+        ]
+        values = self.features[rows]
+        for j, column in enumerate(self.feature_columns):
+            if column in self.integer_columns:
+                column_values = values[:, j].astype(np.int64).tolist()
+            else:
+                # Shortest float32 repr, so 0.123 is not returned as 0.12300000339746475
+                column_values = [float(str(value)) for value in values[:, j]]
+            for record, value in zip(records, column_values):
+                record[column] = value
+        return records
+    
+    def _ensure_index(self):
+        # Models persisted before the index existed build it on first use
+        if getattr(self, "index_matrix", None) is None:
+            self.build_index(self.scaler.transform(self.feature_matrix()))
+    
+    def _probe_cells(self, row: int, n_probe: int) -> np.ndarray:
+        """The query's own cell followed by the n_probe - 1 nearest cells"""
+        cell = self.model.labels_[row]
+        if n_probe <= 1:
+            return np.array([cell])
+        distances = np.linalg.norm(self.model.cluster_centers_ - self.model.cluster_centers_[cell], axis=1)
+        return np.argsort(distances)[:n_probe]
+    
+    @timed("ml_predict")
+    def get_recommendations(
+        self,
+        track_id: str,
+        n_recommendations: int = 5,
+        n_probe: int = 1,
+        exact: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Get music recommendations based on a track from the training set.
+
+        Searches the track's own cluster by default; n_probe widens the search
+        to the nearest clusters and exact scans every track.
+        """
         if self.model is None:
             raise ValueError("Model not trained. Call train_model first.")
+        self._ensure_index()
         
-        # Get the track's features
-        track_features = df[df['id'] == track_id][self.feature_columns].values
-        if len(track_features) == 0:
+        row = self.id_index.get(track_id)
+        if row is None:
             raise ValueError(f"Track {track_id} not found in the dataset")
+        query = self.index_matrix[self.row_positions[row]]
         
-        # Scale the features
-        scaled_features = self.scaler.transform(track_features)
+        # Score each probed cell as a contiguous slice of the index
+        if exact:
+            n_probe = self.model.n_clusters
+        cells = self._probe_cells(row, n_probe)
+        starts = self.cell_offsets[cells]
+        ends = self.cell_offsets[cells + 1]
+        if len(cells) == 1:
+            positions = None
+            scores = self.index_matrix[starts[0]:ends[0]] @ query
+        else:
+            positions = np.concatenate([np.arange(a, b) for a, b in zip(starts, ends)])
+            scores = np.concatenate([self.index_matrix[a:b] @ query for a, b in zip(starts, ends)])
         
-        # Get the cluster of the input track
-        track_cluster = self.model.predict(scaled_features)[0]
+        # Never recommend the seed itself (its cell is always probed first)
+        scores[self.row_positions[row] - starts[0]] = -np.inf
         
-        # Get all tracks in the same cluster
-        cluster_tracks = df[self.model.labels_ == track_cluster]
+        # Top N via partial selection, then order just those
+        k = min(n_recommendations, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        top_positions = starts[0] + top if positions is None else positions[top]
+        recommendations = self._records(self.index_rows[top_positions])
         
-        # Calculate similarity scores
-        similarity_scores = cosine_similarity(
-            scaled_features,
-            self.scaler.transform(cluster_tracks[self.feature_columns])
-        )[0]
+        return recommendations
+    
+    def plan_batch(
+        self,
+        track_ids: List[str],
+        exact: bool = False
+    ) -> Tuple[List[str], np.ndarray, List[Tuple[np.ndarray, int, int]]]:
+        """Resolve seeds to index positions and group them by the index slice to score.
+
+        Returns (seeds, seed_positions, groups) where each group is
+        (member seed indices, slice start, slice end). Unknown seeds are dropped.
+        """
+        if self.model is None:
+            raise ValueError("Model not trained. Call train_model first.")
+        self._ensure_index()
+        
+        seeds = [track_id for track_id in dict.fromkeys(track_ids) if track_id in self.id_index]
+        rows = np.array([self.id_index[track_id] for track_id in seeds], dtype=np.int64)
+        seed_positions = self.row_positions[rows]
+        if not seeds:
+            return seeds, seed_positions, []
         
-        # Get top N recommendations
-        top_indices = np.argsort(similarity_scores)[-n_recommendations-1:-1][::-1]
-        recommendations = cluster_tracks.iloc[top_indices].to_dict('records')
+        if exact:
+            groups = [(np.arange(len(seeds)), 0, len(self.index_rows))]
+        else:
+            cells = self.model.labels_[rows]
+            groups = [
+                (np.flatnonzero(cells == cell), self.cell_offsets[cell], self.cell_offsets[cell + 1])
+                for cell in np.unique(cells)
+            ]
         
+        # Split very large groups so a score block stays around 64 MB
+        max_seeds = max(1, SCORE_BLOCK_SIZE // max(1, len(self.index_rows)))
+        groups = [
+            (members[i:i + max_seeds], int(start), int(end))
+            for members, start, end in groups
+            for i in range(0, len(members), max_seeds)
+        ]
+        return seeds, seed_positions, groups
+    
+    def batch_records(
+        self,
+        seeds: List[str],
+        positions: np.ndarray,
+        counts: np.ndarray
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Turn per-seed index positions into track records keyed by seed"""
+        if not seeds:
+            return {}
+        # Materialise every recommended track once, then split per seed
+        flat_positions = np.concatenate([positions[i, :count] for i, count in enumerate(counts)])
+        records = self._records(self.index_rows[flat_positions])
+        recommendations, offset = {}, 0
+        for seed, count in zip(seeds, counts):
+            recommendations[seed] = records[offset:offset + count]
+            offset += count
         return recommendations
+    
+    @timed("ml_predict_batch")
+    def get_batch_recommendations(
+        self,
+        track_ids: List[str],
+        n_recommendations: int = 5,
+        exact: bool = False
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Recommendations for many seed tracks at once, keyed by seed.
 
-recommender = MusicRecommender()
+        Seeds are grouped by cluster and each group is scored against its
+        cell with a single matrix multiplication followed by a row-wise top-k
+        (or against the whole catalogue when exact). Unknown seeds are omitted.
+        """
+        seeds, seed_positions, groups = self.plan_batch(track_ids, exact)
+        positions, counts = top_k_by_groups(self.index_matrix, seed_positions, groups, n_recommendations)
+        return self.batch_records(seeds, positions, counts)
+
+@contextmanager
+def model_file_lock(model_path: str):
+    """Exclusive lock on a model's files, shared across processes through a sidecar .lock file"""
+    with open(f"{model_path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def save_model(model: MusicRecommender, model_path: str = "models/music_recommender.joblib"):
+    """Save the trained model.
+
+    The feature columns and similarity index go to a float32 feature file
+    next to model_path (see app.feature_file) in cell order; the joblib file
+    keeps the rest. Each save writes a new feature file before switching the
+    joblib file over, so readers never pair a model with the wrong matrix.
+    """
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    model._ensure_index()
+    order = model.index_rows
+    columns = model.feature_columns
+    features = np.asarray(model.feature_matrix(), dtype=np.float32)[order]
+    tracks = model.tracks.drop(columns=columns + ["id"], errors="ignore").iloc[order].reset_index(drop=True)
+    if model.ids is not None:
+        ids = np.asarray(model.ids)[order]
+    else:
+        ids = np.array(model.tracks["id"].astype(str).str.encode("utf-8").tolist(), dtype=bytes)[order]
+    sorted_ids = SortedIds.build(ids)
+    if model.features is not None:
+        integer_columns = model.integer_columns
+    else:
+        integer_columns = [column for column in columns if model.tracks[column].dtype.kind in "iub"]
+    
+    # Saves from every process take turns: each writes its own files, then
+    # switches the joblib file over and prunes feature files it superseded
+    with model_file_lock(model_path):
+        stem = os.path.splitext(model_path)[0]
+        feature_path = f"{stem}.{uuid.uuid4().hex[:12]}.features"
+        write_feature_file(
+            feature_path,
+            {
+                "features": features,
+                "index": model.index_matrix,
+                "ids": ids,
+                "sorted_ids": sorted_ids.sorted_ids,
+                "sorted_rows": sorted_ids.rows.astype(np.int64),
+            },
+            {
+                "columns": columns,
+                "integer_columns": integer_columns,
+                "cell_offsets": [int(offset) for offset in model.cell_offsets],
+            }
+        )
+        
+        # Persist a copy whose rows are in cell order and whose arrays live in the feature file
+        persisted = copy.copy(model)
+        persisted.model = copy.copy(model.model)
+        persisted.model.labels_ = model.model.labels_[order]
+        persisted.tracks = tracks
+        persisted.feature_file = os.path.basename(feature_path)
+        persisted.integer_columns = integer_columns
+        for attribute in ("features", "ids", "index_matrix", "index_rows", "row_positions", "cell_offsets", "id_index"):
+            persisted.__dict__.pop(attribute, None)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(model_path), prefix=os.path.basename(model_path), suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump(persisted, tmp_path)
+            os.replace(tmp_path, model_path)
+        except BaseException:
+            for path in (tmp_path, feature_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        
+        # The previous feature file stays for readers that loaded the joblib file
+        # just before the switch; anything older is no longer referenced
+        older = sorted(
+            (path for path in glob.glob(f"{glob.escape(stem)}.*.features") if path != feature_path),
+            key=os.path.getmtime
+        )
+        for path in older[:-1]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def load_model(model_path: str = "models/music_recommender.joblib") -> Optional[MusicRecommender]:
+    """Load a trained model, mapping its feature file if it has one"""
+    if not os.path.exists(model_path):
+        return None
+    model = joblib.load(model_path)
+    if model.feature_file is not None:
+        model.attach_features(os.path.join(os.path.dirname(model_path), model.feature_file))
+    return model
+
+def model_version(model_path: str) -> Optional[int]:
+    """Modification time of a saved model, None when there is none"""
+    try:
+        return os.stat(model_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def load_model_version(model_path: str) -> Tuple[Optional[MusicRecommender], Optional[int]]:
+    """Load a model together with the modification time it was loaded at.
+
+    A feature file that disappears between reading the joblib file and
+    mapping it belongs to a save that has since been superseded, so the
+    load is retried against the newer joblib file after a short wait.
+    """
+    for attempt in range(MODEL_LOAD_ATTEMPTS):
+        version = model_version(model_path)
+        try:
+            return load_model(model_path), version
+        except FileNotFoundError:
+            if attempt == MODEL_LOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+class ModelRegistry:
+    """Per-user fitted recommenders: persisted on disk, hot ones kept in an LRU"""
+    def __init__(self, model_dir: str = MODEL_DIR, max_models: int = MODEL_CACHE_SIZE):
+        self.model_dir = model_dir
+        # (model, file modification time) per user; users without a model map to (None, None)
+        self.models = TTLCache(max_size=max_models, ttl=float("inf"))
+        # Changes to one user's model run one at a time, from reading it to swapping it
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def path_for(self, user_id: str) -> str:
+        # Spotify user IDs may contain characters that are unsafe in file names
+        digest = hashlib.sha256(user_id.encode()).hexdigest()[:32]
+        return os.path.join(self.model_dir, "users", f"{digest}.joblib")
+
+    def _lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def get(self, user_id: str) -> Optional[MusicRecommender]:
+        """Return the user's model, loading it from disk on first use.
+
+        Entries remember the model file's modification time, so a model saved
+        since by another worker is reloaded; concurrent loads share one read.
+        """
+        path = self.path_for(user_id)
+        loader = lambda: asyncio.to_thread(load_model_version, path)
+        model, version = await self.models.get_or_load(user_id, loader)
+        if version != model_version(path):
+            self.models.delete(user_id)
+            try:
+                model, version = await self.models.get_or_load(user_id, loader)
+            except FileNotFoundError as e:
+                if model is None:
+                    raise
+                # Keep serving the loaded version; the next get tries the reload again
+                logger.warning(f"Error reloading model, serving the previous version: {str(e)}")
+                if user_id not in self.models:
+                    self.models.set(user_id, (model, version))
+        return model
+
+    async def _install(self, user_id: str, model: MusicRecommender):
+        """Make model live, persist it and swap in the memory-mapped copy.
+
+        The saved copy lets every worker serve the model from the same
+        page-cached file. Callers hold the user's lock.
+        """
+        path = self.path_for(user_id)
+        self.models.set(user_id, (model, model_version(path)))
+        await asyncio.to_thread(save_model, model, path)
+        self.models.set(user_id, await asyncio.to_thread(load_model_version, path))
+
+    async def put(self, user_id: str, model: MusicRecommender):
+        """Make a freshly trained model live and persist it"""
+        async with self._lock(user_id):
+            await self._install(user_id, model)
+
+    async def update(self, user_id: str, df: pd.DataFrame) -> Optional[Tuple[MusicRecommender, np.ndarray]]:
+        """Fold tracks into the user's model (see MusicRecommender.update_model).
+
+        Returns None when the user has no model yet, leaving the first fit to
+        the process pool (see submit_training).
+
+        The update is applied to a clone under the user's lock, so concurrent
+        updates are not lost and requests keep reading the previous model
+        until the updated one replaces it.
+        """
+        async with self._lock(user_id):
+            current = await self.get(user_id)
+            if current is None:
+                return None
+            recommender = current.clone()
+            labels = recommender.update_model(df)
+            await self._install(user_id, recommender)
+        return recommender, labels
+
+registry = ModelRegistry()
+
+class BatchRecommendationRequest(BaseModel):
+    track_ids: List[str] = Field(..., min_length=1, max_length=ML_BATCH_MAX_SEEDS)
+    n_recommendations: int = Field(5, ge=1, le=ML_MAX_RECOMMENDATIONS)
+    exact: bool = False
+
+class TrainJobRequest(BaseModel):
+    tracks: List[Dict[str, Any]]
+    n_clusters: int = 5
+    warm_start: bool = False
+    select_k: bool = False
+
+def _release(shm):
+    """Cleanup callback that frees a shared memory block once its job is over"""
+    def cleanup():
+        shm.close()
+        shm.unlink()
+    return cleanup
+
+async def select_n_clusters(features: np.ndarray) -> Dict[str, Any]:
+    """Choose k by silhouette score, evaluating candidates in parallel in the pool.
+
+    Large libraries are scored on a random subsample; inertia is reported
+    alongside so the elbow can be inspected too.
+    """
+    started = time.perf_counter()
+    n_tracks = len(features)
+    if n_tracks > ML_SELECTION_SAMPLE:
+        rng = np.random.default_rng(42)
+        features = features[rng.choice(n_tracks, ML_SELECTION_SAMPLE, replace=False)]
+    candidates = list(range(ML_K_MIN, min(ML_K_MAX, len(features) - 1) + 1))
+    scores = []
+    if candidates:
+        shm, handle = share_array(preprocessing.StandardScaler().fit_transform(features))
+        try:
+            scores = await job_manager.map(score_k_shared, [(handle, k) for k in candidates])
+        finally:
+            _release(shm)()
+    return {
+        "k": max(scores, key=lambda score: score["silhouette"])["k"] if scores else 1,
+        "n_tracks": n_tracks,
+        "sample_size": len(features),
+        "scores": scores,
+        "seconds": time.perf_counter() - started,
+        "cached": False,
+    }
+
+def cached_selection(recommender: Optional[MusicRecommender], n_tracks: int) -> Optional[Dict[str, Any]]:
+    """The user's previously chosen k, unless the library has changed size too much"""
+    selection = getattr(recommender, "k_selection", None)
+    if selection is None or abs(n_tracks - selection["n_tracks"]) > ML_SELECTION_DRIFT * selection["n_tracks"]:
+        return None
+    return {**selection, "cached": True}
+
+async def submit_training(
+    user_id: str,
+    df: pd.DataFrame,
+    n_clusters: int = 5,
+    warm_start: bool = False,
+    select_k: bool = False
+) -> Job:
+    """Fit a fresh model for the user in the process pool.
+
+    The feature matrix is handed to the worker through shared memory and the
+    fitted scaler/KMeans come back to be installed and persisted here. With
+    select_k, n_clusters is replaced by the user's cached or newly selected k.
+    """
+    existing = await registry.get(user_id)
+    # Refit a clone, so the live model is untouched until the new one replaces it
+    recommender = existing.clone() if warm_start and existing is not None else MusicRecommender()
+    features = np.ascontiguousarray(df[recommender.feature_columns].values, dtype=np.float64)
+    shm, handle = share_array(features)
+    selection = getattr(existing, "k_selection", None)
+    fit_started = 0.0
+    
+    async def prepare():
+        nonlocal selection, fit_started
+        k = n_clusters
+        if select_k:
+            selection = cached_selection(existing, len(features)) or await select_n_clusters(features)
+            k = selection["k"]
+        fit_started = time.perf_counter()
+        return handle, k, recommender.warm_start_centers(k) if warm_start else None
+    
+    async def install(fitted):
+        # The fit runs in a pool worker, whose metrics this process never sees
+        operation_duration.observe(time.perf_counter() - fit_started, "ml_train")
+        scaler, model = fitted
+        labels = recommender.apply_fit(df, scaler, model)
+        result = {"n_clusters": len(np.unique(labels)), "n_tracks": len(recommender.tracks)}
+        if selection is not None:
+            recommender.k_selection = {**selection, "cached": False}
+        if select_k:
+            result["k_selection"] = selection
+        await registry.put(user_id, recommender)
+        return result
+    
+    return job_manager.submit(
+        user_id, "train", fit_clusters_shared, (),
+        install, _release(shm), prepare
+    )
+
+def submit_batch_scoring(user_id: str, recommender: MusicRecommender, request: BatchRecommendationRequest) -> Job:
+    """Score many seeds in the process pool against a shared copy of the index"""
+    seeds, seed_positions, groups = recommender.plan_batch(request.track_ids, request.exact)
+    shm, handle = share_array(recommender.index_matrix)
+    started = time.perf_counter()
+    
+    async def collect(scored):
+        operation_duration.observe(time.perf_counter() - started, "ml_predict_batch")
+        positions, counts = scored
+        recommendations = recommender.batch_records(seeds, positions, counts)
+        return {
+            "recommendations": recommendations,
+            "not_found": [track_id for track_id in request.track_ids if track_id not in recommendations],
+        }
+    
+    return job_manager.submit(
+        user_id, "batch_recommendations", top_k_by_groups_shared,
+        (handle, seed_positions, groups, request.n_recommendations),
+        collect, _release(shm)
+    )
 
 @router.post("/train")
-async def train_recommender(tracks_data: List[Dict[str, Any]]):
-    """Train the recommendation model with user's tracks"""
+async def train_recommender(
+    tracks_data: List[Dict[str, Any]],
+    incremental: bool = False,
+    warm_start: bool = False,
+    n_clusters: int = 5,
+    select_k: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Train the recommendation model with user's tracks.
+
+    incremental folds the tracks into the user's existing model (without one
+    it trains a new model); warm_start retrains from scratch but seeds KMeans
+    with the existing centroids. select_k picks n_clusters automatically
+    (see select_n_clusters). Full fits run in the process pool so the event
+    loop stays responsive.
+    """
     try:
         df = pd.DataFrame(tracks_data)
-        labels = recommender.train_model(df)
-        return {"message": "Model trained successfully", "n_clusters": len(np.unique(labels))}
+        updated = await registry.update(current_user["id"], df) if incremental else None
+        if updated is not None:
+            recommender, labels = updated
+            return {
+                "message": "Model trained successfully",
+                "n_clusters": len(np.unique(labels)),
+                "n_tracks": len(recommender.tracks),
+            }
+        job = await job_manager.wait(await submit_training(
+            current_user["id"], df, n_clusters=n_clusters, warm_start=warm_start, select_k=select_k
+        ))
+        if job.status != "done":
+            raise ValueError(job.error or f"Training job {job.status}")
+        return {"message": "Model trained successfully", "job_id": job.id, **job.result}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/recommendations/{track_id}")
-async def get_recommendations(track_id: str, n_recommendations: int = 5):
+async def get_recommendations(
+    track_id: str,
+    n_recommendations: int = 5,
+    n_probe: int = 1,
+    current_user: dict = Depends(get_current_user)
+):
     """Get music recommendations based on a track"""
+    recommender = await registry.get(current_user["id"])
+    if recommender is None:
+        raise HTTPException(status_code=404, detail="No trained model for this user. Call /ml/train first.")
     try:
-        # Load the user's tracks data
-        # In a real application, this would be stored in a database
-        tracks_data = []  # This should be populated with the user's tracks
-        df = pd.DataFrame(tracks_data)
-        
-        recommendations = recommender.get_recommendations(df, track_id, n_recommendations)
+        recommendations = recommender.get_recommendations(track_id, n_recommendations, n_probe=n_probe)
         return recommendations
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-def save_model(model_path: str = "models/music_recommender.joblib"):
-    """Save the trained model"""
-    os.makedirs(os.path.dirname(model_path), exist_ok=True)
-    joblib.dump(recommender, model_path)
+@router.post("/recommendations/batch")
+async def get_batch_recommendations(
+    request: BatchRecommendationRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get recommendations for many seed tracks in one pass.
+
+    Scoring runs in the process pool (see submit_batch_scoring), so a large
+    batch does not hold up the event loop.
+    """
+    recommender = await registry.get(current_user["id"])
+    if recommender is None:
+        raise HTTPException(status_code=404, detail="No trained model for this user. Call /ml/train first.")
+    try:
+        job = await job_manager.wait(submit_batch_scoring(current_user["id"], recommender, request))
+        if job.status != "done":
+            raise ValueError(job.error or f"Batch recommendation job {job.status}")
+        return job.result
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/jobs/train", status_code=202)
+async def start_training_job(
+    request: TrainJobRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Start training in the background; poll /ml/jobs/{job_id} for the result"""
+    try:
+        job = await submit_training(
+            current_user["id"],
+            pd.DataFrame(request.tracks),
+            n_clusters=request.n_clusters,
+            warm_start=request.warm_start,
+            select_k=request.select_k
+        )
+        return job.to_dict()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/jobs/recommendations/batch", status_code=202)
+async def start_batch_recommendations_job(
+    request: BatchRecommendationRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Start batch scoring in the background; poll /ml/jobs/{job_id} for the result"""
+    recommender = await registry.get(current_user["id"])
+    if recommender is None:
+        raise HTTPException(status_code=404, detail="No trained model for this user. Call /ml/train first.")
+    try:
+        return submit_batch_scoring(current_user["id"], recommender, request).to_dict()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Status of one of the user's jobs, with its result once done"""
+    job = job_manager.get(job_id, current_user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-def load_model(model_path: str = "models/music_recommender.joblib"):
-    """Load a trained model"""
-    if os.path.exists(model_path):
-        return joblib.load(model_path)
-    return None 
\ No newline at end of file
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Cancel a queued or running job"""
+    job = job_manager.get(job_id, current_user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job_manager.cancel(job):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return job.to_dict()
@@ -0,0 +1,124 @@
+"""CPU-bound model kernels that run in worker processes.
+
+Kept free of web-framework imports so pool workers start quickly, and
+scikit-learn is imported inside the kernels so the API process that imports
+this module for the helpers does not load it. Feature matrices travel
+through shared memory rather than being pickled.
+"""
+from __future__ import annotations
+import time
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+import numpy as np
+
+if TYPE_CHECKING:
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+SharedArray = Tuple[str, Tuple[int, ...], str]
+
+def share_array(array: np.ndarray) -> Tuple[shared_memory.SharedMemory, SharedArray]:
+    """Copy an array into a new shared memory block and return its handle"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+def attach_array(handle: SharedArray) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    """Map a shared array without copying it"""
+    name, shape, dtype = handle
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+def fit_clusters(
+    features: np.ndarray,
+    n_clusters: int,
+    init_centers: Optional[np.ndarray] = None
+) -> Tuple[StandardScaler, KMeans]:
+    """Fit the feature scaler and KMeans; init_centers are in unscaled feature space"""
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    scaled_features = scaler.fit_transform(features)
+    if init_centers is not None:
+        model = KMeans(n_clusters=n_clusters, init=scaler.transform(init_centers), n_init=1, random_state=42)
+    else:
+        model = KMeans(n_clusters=n_clusters, random_state=42)
+    model.fit(scaled_features)
+    return scaler, model
+
+def fit_clusters_shared(
+    handle: SharedArray,
+    n_clusters: int,
+    init_centers: Optional[np.ndarray] = None
+) -> Tuple[StandardScaler, KMeans]:
+    shm, features = attach_array(handle)
+    try:
+        return fit_clusters(features, n_clusters, init_centers)
+    finally:
+        del features
+        shm.close()
+
+def score_k(scaled_features: np.ndarray, n_clusters: int) -> Dict[str, Any]:
+    """Fit KMeans for one candidate k and score it by silhouette and inertia"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+    from threadpoolctl import threadpool_limits
+    started = time.perf_counter()
+    # Candidates run side by side in the pool, so each keeps to one thread
+    with threadpool_limits(limits=1):
+        model = KMeans(n_clusters=n_clusters, n_init=3, random_state=42).fit(scaled_features)
+        silhouette = silhouette_score(scaled_features, model.labels_)
+    return {
+        "k": n_clusters,
+        "silhouette": float(silhouette),
+        "inertia": float(model.inertia_),
+        "seconds": time.perf_counter() - started,
+    }
+
+def score_k_shared(handle: SharedArray, n_clusters: int) -> Dict[str, Any]:
+    shm, scaled_features = attach_array(handle)
+    try:
+        return score_k(scaled_features, n_clusters)
+    finally:
+        del scaled_features
+        shm.close()
+
+def top_k_by_groups(
+    index_matrix: np.ndarray,
+    seed_positions: np.ndarray,
+    groups: List[Tuple[np.ndarray, int, int]],
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k index positions for each seed, scoring each group of seeds against
+    one contiguous slice of the index with a single matrix multiplication.
+
+    Returns (positions, counts): row i holds counts[i] valid positions.
+    """
+    result_positions = np.zeros((len(seed_positions), k), dtype=np.int64)
+    result_counts = np.zeros(len(seed_positions), dtype=np.int64)
+    for members, start, end in groups:
+        scores = index_matrix[seed_positions[members]] @ index_matrix[start:end].T
+        # Never recommend a seed to itself
+        scores[np.arange(len(members)), seed_positions[members] - start] = -np.inf
+        group_k = min(k, end - start - 1)
+        if group_k <= 0:
+            continue
+        top = np.argpartition(scores, -group_k, axis=1)[:, -group_k:]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        result_positions[members, :group_k] = start + np.take_along_axis(top, order, axis=1)
+        result_counts[members] = group_k
+    return result_positions, result_counts
+
+def top_k_by_groups_shared(
+    handle: SharedArray,
+    seed_positions: np.ndarray,
+    groups: List[Tuple[np.ndarray, int, int]],
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    shm, index_matrix = attach_array(handle)
+    try:
+        return top_k_by_groups(index_matrix, seed_positions, groups, k)
+    finally:
+        del index_matrix
+        shm.close()
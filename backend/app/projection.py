@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Optional
+
+# Compact default schemas for Spotify objects; fields=* returns them whole
+TRACK_FIELDS = (
+    "id,name,uri,duration_ms,popularity,explicit,preview_url,"
+    "artists.id,artists.name,album.id,album.name,album.release_date,album.images,"
+    "audio_features"
+)
+ARTIST_FIELDS = "id,name,uri,genres,popularity,images,followers.total"
+PLAY_HISTORY_FIELDS = "played_at," + ",".join(f"track.{field}" for field in TRACK_FIELDS.split(","))
+
+FieldTree = Optional[Dict[str, Any]]
+
+@lru_cache(maxsize=256)
+def parse_fields(spec: Optional[str]) -> FieldTree:
+    """Turn "id,artists.name,album.images" into a nested field tree; "*" selects everything"""
+    if spec is None or spec.strip() in ("", "*"):
+        return None
+    tree: Dict[str, Any] = {}
+    for path in spec.split(","):
+        node = tree
+        parts = [part for part in path.strip().split(".") if part]
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                # A whole field wins over any of its sub-fields
+                node[part] = None
+            elif node.get(part, {}) is None:
+                break
+            else:
+                node = node.setdefault(part, {})
+    return tree
+
+def project(value: Any, tree: FieldTree) -> Any:
+    """Keep only the fields in tree, applying it to every element of lists"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+def omit(value: Any, names: FrozenSet[str]) -> Any:
+    """Drop the named fields at every level, e.g. available_markets of tracks and their albums"""
+    if isinstance(value, list):
+        return [omit(item, names) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: omit(item, names) for key, item in value.items() if key not in names}
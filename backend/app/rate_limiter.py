@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+import httpx
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Outbound request budget for the whole app and for each user token
+SPOTIFY_APP_RATE = float(os.getenv("SPOTIFY_APP_RATE", "25"))
+SPOTIFY_APP_BURST = float(os.getenv("SPOTIFY_APP_BURST", "50"))
+SPOTIFY_USER_RATE = float(os.getenv("SPOTIFY_USER_RATE", "10"))
+SPOTIFY_USER_BURST = float(os.getenv("SPOTIFY_USER_BURST", "20"))
+
+# Retry policy
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+SPOTIFY_BACKOFF_BASE = float(os.getenv("SPOTIFY_BACKOFF_BASE", "0.5"))
+SPOTIFY_BACKOFF_MAX = float(os.getenv("SPOTIFY_BACKOFF_MAX", "8"))
+# Longer Retry-After values are surfaced to the caller instead of queueing
+SPOTIFY_MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "30"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+Sender = Callable[..., Awaitable[httpx.Response]]
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting callers"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token and return how long the caller must wait for it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self):
+        """Give back the token of a reservation that was abandoned"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+def _retry_after_seconds(response: httpx.Response) -> float:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", "1")))
+    except ValueError:
+        return 1.0
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(SPOTIFY_BACKOFF_MAX, SPOTIFY_BACKOFF_BASE * 2 ** attempt))
+
+class RequestScheduler:
+    """Central throttle for outbound Spotify requests.
+
+    Requests queue behind an app-wide and a per-user token bucket, wait out any
+    Retry-After announced by a 429, and idempotent requests are retried with
+    jittered backoff on transport errors and 5xx responses.
+    """
+    def __init__(
+        self,
+        app_rate: float = SPOTIFY_APP_RATE,
+        app_burst: float = SPOTIFY_APP_BURST,
+        user_rate: float = SPOTIFY_USER_RATE,
+        user_burst: float = SPOTIFY_USER_BURST,
+        max_retries: int = SPOTIFY_MAX_RETRIES
+    ):
+        self.app_bucket = TokenBucket(app_rate, app_burst)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.user_buckets = TTLCache(max_size=10000, ttl=600)
+        self.max_retries = max_retries
+        self.blocked_until = 0.0
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.throttled_requests = 0
+        self.throttle_seconds = 0.0
+        self.rate_limited_responses = 0
+        self.retries = 0
+
+    def _user_bucket(self, user_key: str) -> TokenBucket:
+        bucket = self.user_buckets.get(user_key)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+        # Refresh the entry so active users keep their bucket state
+        self.user_buckets.set(user_key, bucket)
+        return bucket
+
+    async def _wait_for(self, bucket: TokenBucket, respect_pause: bool = False) -> bool:
+        """Reserve a token from bucket and sleep until it is due, refunding it if cancelled"""
+        delay = bucket.reserve()
+        if respect_pause:
+            delay = max(delay, self.blocked_until - time.monotonic())
+        if delay <= 0:
+            return False
+        self.throttle_seconds += delay
+        self.queue_depth += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        try:
+            await asyncio.sleep(delay)
+            # A 429 may have extended the pause while this request was queued
+            remaining = self.blocked_until - time.monotonic() if respect_pause else 0
+            if remaining > 0:
+                self.throttle_seconds += remaining
+                await asyncio.sleep(remaining)
+        except asyncio.CancelledError:
+            bucket.refund()
+            raise
+        finally:
+            self.queue_depth -= 1
+        return True
+
+    async def _acquire(self, user_key: Optional[str]):
+        """Wait for the user's bucket, then for the app-wide one.
+
+        The app token is only reserved once the user's budget allows the
+        request, so a busy user's backlog holds no app tokens for others to
+        queue behind.
+        """
+        user_bucket = self._user_bucket(user_key) if user_key else None
+        throttled = user_bucket is not None and await self._wait_for(user_bucket)
+        try:
+            throttled = await self._wait_for(self.app_bucket, respect_pause=True) or throttled
+        except asyncio.CancelledError:
+            # The request is never sent, so its user token is not spent either
+            if user_bucket is not None:
+                user_bucket.refund()
+            raise
+        if throttled:
+            self.throttled_requests += 1
+
+    async def send(self, send: Sender, method: str, url: str, user_key: Optional[str] = None, **kwargs) -> httpx.Response:
+        """Send a request through the throttle, retrying where it is safe to"""
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await self._acquire(user_key)
+            try:
+                response = await send(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Retrying {method} {url} after transport error: {str(e)}")
+            else:
+                if response.status_code == 429:
+                    # Spotify did not process the request, so any method may be replayed
+                    self.rate_limited_responses += 1
+                    retry_after = _retry_after_seconds(response)
+                    if attempt >= self.max_retries or retry_after > SPOTIFY_MAX_RETRY_AFTER:
+                        return response
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+                    logger.warning(f"Spotify rate limited {method} {url}; pausing for {retry_after}s")
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                if response.status_code < 500 or not idempotent or attempt >= self.max_retries:
+                    return response
+                logger.warning(f"Retrying {method} {url} after status {response.status_code}")
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+            self.retries += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "throttled_requests": self.throttled_requests,
+            "throttle_seconds": round(self.throttle_seconds, 3),
+            "rate_limited_responses": self.rate_limited_responses,
+            "retries": self.retries,
+            "paused_for": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            "active_users": len(self.user_buckets),
+        }
+
+scheduler = RequestScheduler()
@@ -0,0 +1,11 @@
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: responses fall back to the standard library encoder
+    orjson = None
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+else:
+    FastJSONResponse = JSONResponse
@@ -1,102 +1,210 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from ..spotify_auth import get_current_user, get_spotify_api_client
-from ..data_pipeline import analyze_user_data
-from typing import List, Dict
+from ..spotify_client import SpotifyClient
+from ..feature_store import feature_store
+from ..snapshots import SNAPSHOT_LIMIT, TIME_RANGES, compute_etag, snapshot_sections, snapshot_service
+from ..data_pipeline import stream_saved_tracks, stream_playlist_tracks, enrich_with_features
+from ..projection import ARTIST_FIELDS, PLAY_HISTORY_FIELDS, TRACK_FIELDS, parse_fields, project
+from ..responses import FastJSONResponse
+from typing import List, Dict, Optional
+import json
 import logging
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
+async def get_cached_audio_features(sp: SpotifyClient, track_ids: List[str]) -> Dict[str, Dict]:
+    """Audio features keyed by track ID, fetching only IDs not in the feature store"""
+    return await feature_store.get_many(track_ids, sp.get_audio_features_by_id)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match covers the given (quoted) ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+async def snapshot_response(
+    request: Request,
+    current_user: dict,
+    section: str,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None
+) -> Response:
+    """Serve a (projected) section of the user's analytics snapshot, or 304 if the client has it"""
+    snapshot = await snapshot_service.get(current_user["id"], current_user["access_token"])
+    sp = get_spotify_api_client(current_user["access_token"])
+    entry = (await snapshot_sections(sp, snapshot, [section]))[section]
+    etag = '"' + compute_etag([entry["etag"], limit, fields]) + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    data = entry["data"] if limit is None else entry["data"][:limit]
+    return FastJSONResponse(project(data, parse_fields(fields)), headers=headers)
+
+def from_snapshot(time_range: Optional[str], limit: int) -> bool:
+    return (time_range is None or time_range in TIME_RANGES) and 0 < limit <= SNAPSHOT_LIMIT
+
 @router.get("/top-tracks")
 async def get_top_tracks(
+    request: Request,
     time_range: str = "medium_term",
     limit: int = 20,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get user's top tracks"""
+    """Get user's top tracks.
+
+    fields selects the attributes returned (e.g. "id,name,artists.name");
+    by default a compact schema is used and fields=* returns full objects
+    (less the market lists, see SNAPSHOT_OMITTED_FIELDS).
+    """
+    fields = TRACK_FIELDS if fields is None else fields
     try:
+        if from_snapshot(time_range, limit):
+            return await snapshot_response(request, current_user, f"top_tracks:{time_range}", limit, fields)
+        
         # Initialize Spotify client with the access token
         sp = get_spotify_api_client(current_user["access_token"])
-        tracks = sp.current_user_top_tracks(time_range=time_range, limit=limit)
-        
-        # Get audio features for the tracks in smaller batches
-        track_ids = [track["id"] for track in tracks["items"]]
-        features = []
+        tracks = await sp.get_top_tracks(time_range=time_range, limit=limit)
         
-        # Process in batches of 20 (Spotify's limit)
-        batch_size = 20
-        for i in range(0, len(track_ids), batch_size):
-            batch = track_ids[i:i + batch_size]
-            try:
-                batch_features = sp.audio_features(batch)
-                features.extend(batch_features if batch_features else [])
-            except Exception as e:
-                logging.error(f"Error fetching audio features for batch: {str(e)}")
-                # Continue with other batches even if one fails
-                continue
+        # Get audio features for the tracks, reusing stored features
+        track_ids = [track["id"] for track in tracks]
+        features = await get_cached_audio_features(sp, track_ids)
         
         # Combine track data with audio features
-        for track, feature in zip(tracks["items"], features):
-            if feature:
-                track["audio_features"] = feature
+        for track in tracks:
+            if track["id"] in features:
+                track["audio_features"] = features[track["id"]]
         
-        return tracks["items"]
+        return FastJSONResponse(project(tracks, parse_fields(fields)))
     except Exception as e:
         logging.error(f"Error in get_top_tracks: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/top-artists")
 async def get_top_artists(
+    request: Request,
     time_range: str = "medium_term",
     limit: int = 20,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get user's top artists"""
+    """Get user's top artists (fields as for /top-tracks)"""
+    fields = ARTIST_FIELDS if fields is None else fields
     try:
+        if from_snapshot(time_range, limit):
+            return await snapshot_response(request, current_user, f"top_artists:{time_range}", limit, fields)
+        
         # Initialize Spotify client with the access token
         sp = get_spotify_api_client(current_user["access_token"])
-        artists = sp.current_user_top_artists(time_range=time_range, limit=limit)
-        return artists["items"]
+        artists = await sp.get_top_artists(time_range=time_range, limit=limit)
+        return FastJSONResponse(project(artists, parse_fields(fields)))
     except Exception as e:
         logging.error(f"Error in get_top_artists: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/recently-played")
 async def get_recently_played(
+    request: Request,
     limit: int = 50,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get user's recently played tracks"""
+    """Get user's recently played tracks (fields as for /top-tracks, e.g. "played_at,track.name")"""
+    fields = PLAY_HISTORY_FIELDS if fields is None else fields
     try:
+        if from_snapshot(None, limit):
+            return await snapshot_response(request, current_user, "recently_played", limit, fields)
+        
         # Initialize Spotify client with the access token
         sp = get_spotify_api_client(current_user["access_token"])
-        recent = sp.current_user_recently_played(limit=limit)
+        recent = await sp.get_recently_played(limit=limit)
         
-        # Get audio features for the tracks in smaller batches
-        track_ids = [item["track"]["id"] for item in recent["items"]]
-        features = []
-        
-        # Process in batches of 20 (Spotify's limit)
-        batch_size = 20
-        for i in range(0, len(track_ids), batch_size):
-            batch = track_ids[i:i + batch_size]
-            try:
-                batch_features = sp.audio_features(batch)
-                features.extend(batch_features if batch_features else [])
-            except Exception as e:
-                logging.error(f"Error fetching audio features for batch: {str(e)}")
-                # Continue with other batches even if one fails
-                continue
+        # Get audio features for the tracks, reusing stored features
+        track_ids = [item["track"]["id"] for item in recent]
+        features = await get_cached_audio_features(sp, track_ids)
         
         # Combine track data with audio features
-        for item, feature in zip(recent["items"], features):
-            if feature:
-                item["track"]["audio_features"] = feature
+        for item in recent:
+            if item["track"]["id"] in features:
+                item["track"]["audio_features"] = features[item["track"]["id"]]
         
-        return recent["items"]
+        return FastJSONResponse(project(recent, parse_fields(fields)))
     except Exception as e:
         logging.error(f"Error in get_recently_played: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/aggregates")
+async def get_aggregates(
+    request: Request,
+    time_range: str = "medium_term",
+    current_user: dict = Depends(get_current_user)
+):
+    """Get the user's mean audio feature profile and genre distribution"""
+    if time_range not in TIME_RANGES:
+        raise HTTPException(status_code=400, detail=f"time_range must be one of {', '.join(TIME_RANGES)}")
+    try:
+        return await snapshot_response(request, current_user, f"aggregates:{time_range}")
+    except Exception as e:
+        logging.error(f"Error in get_aggregates: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/dashboard")
+async def get_dashboard(
+    request: Request,
+    time_range: str = "medium_term",
+    limit: int = 20,
+    recent_limit: int = 50,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get everything the dashboard shows in one response.
+
+    Served from the user's analytics snapshot, whose build fetches every
+    section from Spotify concurrently and enriches all tracks with a single
+    audio features lookup; sections the build could not fetch are fetched
+    live. Tracks and artists use the compact schemas
+    unless fields=* asks for full objects.
+    """
+    full = fields is not None and fields.strip() == "*"
+    if not from_snapshot(time_range, limit) or not from_snapshot(None, recent_limit):
+        raise HTTPException(
+            status_code=400,
+            detail=f"time_range must be one of {', '.join(TIME_RANGES)} and limits between 1 and {SNAPSHOT_LIMIT}"
+        )
+    try:
+        snapshot = await snapshot_service.get(current_user["id"], current_user["access_token"])
+        names = [f"top_tracks:{time_range}", f"top_artists:{time_range}", "recently_played", f"aggregates:{time_range}"]
+        sp = get_spotify_api_client(current_user["access_token"])
+        sections = await snapshot_sections(sp, snapshot, names)
+        etag = '"' + compute_etag([sections[name]["etag"] for name in names] + [limit, recent_limit, full]) + '"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return FastJSONResponse({
+            "time_range": time_range,
+            "built_at": snapshot["built_at"],
+            "top_tracks": project(
+                sections[f"top_tracks:{time_range}"]["data"][:limit],
+                None if full else parse_fields(TRACK_FIELDS)
+            ),
+            "top_artists": project(
+                sections[f"top_artists:{time_range}"]["data"][:limit],
+                None if full else parse_fields(ARTIST_FIELDS)
+            ),
+            "recently_played": project(
+                sections["recently_played"]["data"][:recent_limit],
+                None if full else parse_fields(PLAY_HISTORY_FIELDS)
+            ),
+            "aggregates": sections[f"aggregates:{time_range}"]["data"],
+        }, headers=headers)
+    except Exception as e:
+        logging.error(f"Error in get_dashboard: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/audio-features")
 async def get_audio_features(
     track_ids: List[str],
@@ -104,6 +212,28 @@ async def get_audio_features(
 ):
     """Get audio features for tracks"""
     try:
-        return await analyze_user_data.get_audio_features(track_ids)
+        sp = get_spotify_api_client(current_user["access_token"])
+        features = await get_cached_audio_features(sp, track_ids)
+        return [features.get(track_id) for track_id in track_ids]
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/library")
+async def stream_library(
+    playlist_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream the user's saved tracks (or a playlist's tracks) with audio features as NDJSON"""
+    sp = get_spotify_api_client(current_user["access_token"])
+    tracks = stream_playlist_tracks(sp, playlist_id) if playlist_id else stream_saved_tracks(sp)
+
+    async def ndjson():
+        try:
+            async for track in enrich_with_features(sp, tracks):
+                yield json.dumps(track) + "\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logging.error(f"Error in stream_library: {str(e)}")
+            yield json.dumps({"error": {"status": 500, "message": str(e)}}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
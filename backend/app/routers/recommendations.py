@@ -1,14 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from ..spotify_auth import get_current_user, get_spotify_api_client
-from typing import List, Dict, Optional
+from ..spotify_client import SpotifyClient, SpotifyAPIError
+from ..cache import TTLCache
+from typing import Any, List, Dict, Optional, Tuple
+import asyncio
 import logging
+import os
+import time
 import traceback
-import spotipy
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 logger = logging.getLogger(__name__)
 
+# Similar-track lists are shared across users: fresh for SIMILAR_TRACKS_TTL, then
+# served for up to SIMILAR_TRACKS_STALE_TTL more while a background refresh runs
+SIMILAR_TRACKS_TTL = float(os.getenv("SIMILAR_TRACKS_TTL", "3600"))
+SIMILAR_TRACKS_STALE_TTL = float(os.getenv("SIMILAR_TRACKS_STALE_TTL", "86400"))
+SIMILAR_TRACKS_CACHE_SIZE = int(os.getenv("SIMILAR_TRACKS_CACHE_SIZE", "5000"))
+similar_tracks_cache = TTLCache(
+    max_size=SIMILAR_TRACKS_CACHE_SIZE,
+    ttl=SIMILAR_TRACKS_TTL + SIMILAR_TRACKS_STALE_TTL
+)
+_refreshing: Dict[Tuple, asyncio.Task] = {}
+
 class RecommendationRequest(BaseModel):
     track_id: str
     limit: Optional[int] = 20
@@ -22,8 +37,8 @@ async def get_music_recommendations(
 ):
     """Get personalized music recommendations"""
     try:
-        return await get_recommendations(
-            user_id=current_user["id"],
+        sp = get_spotify_api_client(current_user["access_token"])
+        return await sp.recommendations(
             seed_tracks=seed_tracks,
             seed_artists=seed_artists,
             limit=limit
@@ -31,45 +46,86 @@ async def get_music_recommendations(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+class TrackNotFound(Exception):
+    """The seed track does not exist"""
+
+async def seed_exists(sp: SpotifyClient, track_id: str) -> bool:
+    """Whether Spotify knows the track (a malformed ID is answered with 400)"""
+    try:
+        await sp.track(track_id)
+    except SpotifyAPIError as e:
+        if e.status_code in (400, 404):
+            return False
+        raise
+    return True
+
+async def fetch_similar_tracks(sp: SpotifyClient, key: Tuple) -> Dict[str, Any]:
+    """Recommendations seeded by one track; an unknown seed is rejected by the same call.
+
+    Spotify answers an unknown seed with 400 "invalid request", the same
+    status as other bad parameters (e.g. market), so a 400 is only reported
+    as a missing track once a track lookup confirms it.
+    """
+    track_id, limit, market = key
+    params = {"market": market} if market else {}
+    try:
+        recommendations = await sp.recommendations(seed_tracks=[track_id], limit=limit, **params)
+    except SpotifyAPIError as e:
+        if e.status_code == 404 or (e.status_code == 400 and not await seed_exists(sp, track_id)):
+            raise TrackNotFound(track_id)
+        raise
+    return {"fetched_at": time.time(), "recommendations": recommendations}
+
+def refresh_similar_tracks(sp: SpotifyClient, key: Tuple):
+    """Replace a stale entry in the background, at most once at a time per key"""
+    task = _refreshing.get(key)
+    if task is not None and not task.done():
+        return
+
+    async def refresh():
+        try:
+            similar_tracks_cache.set(key, await fetch_similar_tracks(sp, key))
+        except TrackNotFound:
+            similar_tracks_cache.delete(key)
+        except Exception as e:
+            logger.error(f"Error refreshing similar tracks: {str(e)}")
+        finally:
+            _refreshing.pop(key, None)
+    _refreshing[key] = asyncio.create_task(refresh())
+
+async def get_similar_tracks_cached(sp: SpotifyClient, track_id: str, limit: int, market: Optional[str]) -> Dict[str, Any]:
+    """Cached recommendations for a seed track, revalidated in the background once stale"""
+    key = (track_id, limit, market)
+    entry = await similar_tracks_cache.get_or_load(key, lambda: fetch_similar_tracks(sp, key))
+    if time.time() - entry["fetched_at"] > SIMILAR_TRACKS_TTL:
+        refresh_similar_tracks(sp, key)
+    return entry["recommendations"]
+
 @router.get("/similar-tracks")
 async def get_similar_tracks(
     track_id: str = Query(..., description="Spotify track ID"),
     limit: int = Query(20, ge=1, le=100, description="Number of recommendations to return"),
-    sp: spotipy.Spotify = Depends(get_spotify_api_client)
+    market: Optional[str] = Query(None, description="ISO 3166-1 alpha-2 country code"),
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        # First verify the track exists
+        sp = get_spotify_api_client(current_user["access_token"])
         try:
-            track = sp.track(track_id)
-            if not track:
-                return {
-                    "error": {
-                        "status": 404,
-                        "message": f"Track not found: {track_id}"
-                    }
-                }
-        except Exception as e:
-            logger.error(f"Error verifying track: {str(e)}")
+            return await get_similar_tracks_cached(sp, track_id, limit, market)
+        except TrackNotFound:
             return {
                 "error": {
                     "status": 404,
                     "message": f"Track not found: {track_id}"
                 }
             }
-
-        # Get recommendations
-        try:
-            recommendations = sp.recommendations(
-                seed_tracks=[track_id],
-                limit=limit,
-            )
-            return recommendations
         except Exception as e:
             logger.error(f"Error getting recommendations: {str(e)}")
             return {
                 "error": {
                     "status": 400,
-                    "message": str(e)
+                    # Pass Spotify's own explanation of a bad request through
+                    "message": e.message if isinstance(e, SpotifyAPIError) and e.status_code == 400 else str(e)
                 }
             }
 
@@ -80,4 +136,4 @@ async def get_similar_tracks(
                 "status": 500,
                 "message": str(e)
             }
-        } 
\ No newline at end of file
+        }
\ No newline at end of file
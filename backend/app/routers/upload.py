@@ -1,10 +1,25 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException
-from typing import Optional
-import httpx
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Request
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import hashlib
 import logging
 import os
+import uuid
 from pathlib import Path
 import json
+import anyio
+from ..spotify_client import (
+    SpotifyClient,
+    SpotifyAPIError,
+    PLAYLIST_ITEMS_BATCH_SIZE,
+    SAVED_TRACKS_BATCH_SIZE,
+    SPOTIFY_BATCH_CONCURRENCY,
+)
+from ..cache import TTLCache
+from ..data_pipeline import stream_playlists
+from ..audio_analysis import extract_features
+from ..feature_store import feature_store
+from ..ml_jobs import job_manager
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -13,7 +28,19 @@ logger = logging.getLogger(__name__)
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-SPOTIFY_API_BASE = "https://api.spotify.com/v1"
+# Uploads are consumed in fixed-size chunks and rejected as soon as they pass the limit
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Playlist names shown in upload results, per token so private playlists stay private
+PLAYLIST_CACHE_TTL = float(os.getenv("PLAYLIST_CACHE_TTL", "300"))
+playlist_cache = TTLCache(max_size=10000, ttl=PLAYLIST_CACHE_TTL)
+
+async def get_playlist_name(client: SpotifyClient, playlist_id: str) -> Optional[str]:
+    """A playlist's name, fetched at most once per cache lifetime"""
+    async def load():
+        return (await client.playlist(playlist_id, fields="name")).get("name")
+    return await playlist_cache.get_or_load((client.user_key, playlist_id), load)
 
 @router.get("/playlists")
 async def get_user_playlists(
@@ -31,24 +58,19 @@ async def get_user_playlists(
             
         logger.info("Fetching user playlists")
         
-        async with httpx.AsyncClient() as client:
-            # Get current user's playlists
-            response = await client.get(
-                f"{SPOTIFY_API_BASE}/me/playlists",
-                params={"limit": 50},
-                headers={"Authorization": f"Bearer {token}"}
+        client = SpotifyClient(token)
+        # Get all of the current user's playlists, page by page
+        try:
+            items = [playlist async for playlist in stream_playlists(client)]
+        except SpotifyAPIError as e:
+            logger.error(f"Spotify API error: {e.message}")
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=f"Spotify API error: {e.message}"
             )
-            
-            if response.status_code != 200:
-                logger.error(f"Spotify API error: {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Spotify API error: {response.text}"
-                )
 
-            playlists = response.json()
-            logger.info(f"Found {len(playlists.get('items', []))} playlists")
-            return playlists
+        logger.info(f"Found {len(items)} playlists")
+        return {"items": items, "total": len(items)}
 
     except Exception as e:
         logger.error(f"Error fetching playlists: {str(e)}")
@@ -61,121 +83,252 @@ async def get_user_playlists(
             }
         }
 
+def bearer_token(authorization: Optional[str]) -> str:
+    if not authorization:
+        raise HTTPException(status_code=401, detail="No authorization header provided")
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header format")
+    # Extract the token from the Bearer header
+    return authorization.split(" ")[1]
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read a multipart upload chunk by chunk instead of all at once"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+async def iter_fixed_chunks(stream: AsyncIterator[bytes], chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Regroup a request body stream into chunk_size blocks"""
+    buffer = bytearray()
+    async for data in stream:
+        buffer += data
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+async def receive_upload(
+    chunks: AsyncIterator[bytes],
+    destination: Optional[Path] = None,
+    max_bytes: int = UPLOAD_MAX_BYTES
+) -> Dict[str, Any]:
+    """Consume an upload, hashing it on the fly and enforcing max_bytes.
+
+    The bytes are only written (asynchronously, to a temporary file renamed
+    into place at the end) when a destination is given; callers that only
+    need metadata never touch the disk.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    part_path = None if destination is None else destination.with_name(f".{uuid.uuid4().hex}.part")
+    try:
+        out = await anyio.open_file(part_path, "wb") if part_path is not None else None
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                if out is not None:
+                    await out.write(chunk)
+        finally:
+            if out is not None:
+                await out.aclose()
+        if part_path is not None:
+            await anyio.Path(part_path).replace(destination)
+    except BaseException:
+        if part_path is not None:
+            await anyio.Path(part_path).unlink(missing_ok=True)
+        raise
+    return {"size": size, "sha256": digest.hexdigest(), "path": destination}
+
+async def local_audio_features(received: Dict[str, Any]) -> Dict[str, Any]:
+    """Audio features of a stored upload, extracted in the process pool.
+
+    Results are kept in the feature store under a content-derived "local:"
+    ID, so a file is only analysed once; the stored copy is removed after.
+    """
+    track_id = f"local:{received['sha256'][:32]}"
+
+    async def extract(track_ids):
+        features = await job_manager.run(extract_features, str(received["path"]))
+        return {track_id: {"id": track_id, **features}}
+
+    try:
+        features = await feature_store.get_many([track_id], extract)
+    finally:
+        await anyio.Path(received["path"]).unlink(missing_ok=True)
+    return features[track_id]
+
+async def process_upload(
+    client: SpotifyClient,
+    filename: str,
+    chunks: AsyncIterator[bytes],
+    playlist_id: Optional[str] = None,
+    add_to_liked: bool = False,
+    analyze: bool = False
+) -> Dict[str, Any]:
+    """Receive an upload, then match it on Spotify and (with analyze) extract its features concurrently"""
+    # The file name is enough to find the track, so the body is only stored when it will be analysed
+    destination = UPLOAD_DIR / f"{uuid.uuid4().hex}.mp3" if analyze else None
+    received = await receive_upload(chunks, destination)
+
+    if not analyze:
+        response = await add_track_from_filename(client, filename, playlist_id, add_to_liked)
+    else:
+        response, features = await asyncio.gather(
+            add_track_from_filename(client, filename, playlist_id, add_to_liked),
+            local_audio_features(received),
+            return_exceptions=True
+        )
+        if isinstance(response, BaseException):
+            raise response
+        if isinstance(features, BaseException):
+            logger.error(f"Error analysing {filename}: {str(features)}")
+            response["analysis_error"] = str(features)
+        else:
+            response["audio_features"] = features
+    response["size"] = received["size"]
+    response["sha256"] = received["sha256"]
+    return response
+
+async def add_track_from_filename(
+    client: SpotifyClient,
+    filename: str,
+    playlist_id: Optional[str] = None,
+    add_to_liked: bool = False
+) -> Dict[str, Any]:
+    """Find the track an MP3 file name refers to and add it to a playlist and/or liked songs"""
+    response = {
+        "message": "File uploaded successfully",
+        "filename": filename,
+        "playlist_id": playlist_id,
+        "add_to_liked": add_to_liked
+    }
+
+    # First, search for the track on Spotify
+    search_response = await client.send(
+        "GET", "/search",
+        params={
+            "q": filename.replace('.mp3', ''),
+            "type": "track",
+            "limit": 1
+        }
+    )
+
+    if search_response.status_code != 200:
+        logger.error(f"Error searching for track: {search_response.text}")
+        response["error"] = f"Error searching for track: {search_response.text}"
+        return response
+
+    search_results = search_response.json()
+    tracks = search_results.get('tracks', {}).get('items', [])
+
+    if not tracks:
+        response["error"] = "Could not find matching track on Spotify"
+        return response
+
+    track_uri = tracks[0]['uri']
+    response["track_uri"] = track_uri
+    response["track_name"] = tracks[0]['name']
+    response["artist_name"] = tracks[0]['artists'][0]['name']
+
+    # Add to playlist if specified
+    if playlist_id:
+        try:
+            playlist_response = await client.send(
+                "POST", f"/playlists/{playlist_id}/tracks",
+                json={"uris": [track_uri]}
+            )
+                
+            if playlist_response.status_code == 201:
+                response["playlist_name"] = await get_playlist_name(client, playlist_id)
+                logger.info(f"Added to playlist: {response['playlist_name']}")
+            else:
+                logger.error(f"Error adding to playlist: {playlist_response.text}")
+                response["error"] = f"Error adding to playlist: {playlist_response.text}"
+        except Exception as e:
+            logger.error(f"Error adding to playlist: {str(e)}")
+            response["error"] = f"Error adding to playlist: {str(e)}"
+
+    # Add to liked songs if specified
+    if add_to_liked:
+        try:
+            liked_response = await client.send(
+                "PUT", "/me/tracks",
+                json={"ids": [track_uri.split(':')[-1]]}
+            )
+                
+            if liked_response.status_code == 200:
+                logger.info("Added to liked songs")
+            else:
+                logger.error(f"Error adding to liked songs: {liked_response.text}")
+                response["error"] = f"Error adding to liked songs: {liked_response.text}"
+        except Exception as e:
+            logger.error(f"Error adding to liked songs: {str(e)}")
+            response["error"] = f"Error adding to liked songs: {str(e)}"
+
+    return response
+
 @router.post("/upload")
 async def upload_track(
     file: UploadFile = File(...),
     playlist_id: Optional[str] = Form(None),
     add_to_liked: bool = Form(False),
+    analyze: bool = Form(False),
     authorization: Optional[str] = Header(None),
 ):
     try:
-        if not authorization:
-            raise HTTPException(status_code=401, detail="No authorization header provided")
-            
-        if not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Invalid authorization header format")
-
-        # Extract the token from the Bearer header
-        token = authorization.split(" ")[1]
+        token = bearer_token(authorization)
 
         if not file.filename.endswith('.mp3'):
             raise HTTPException(status_code=400, detail="Only MP3 files are allowed")
+        if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File is larger than {UPLOAD_MAX_BYTES} bytes")
 
-        # Save the uploaded file
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-
-        response = {
-            "message": "File uploaded successfully",
-            "filename": file.filename,
-            "playlist_id": playlist_id,
-            "add_to_liked": add_to_liked
-        }
-
-        async with httpx.AsyncClient() as client:
-            # First, search for the track on Spotify
-            search_response = await client.get(
-                f"{SPOTIFY_API_BASE}/search",
-                params={
-                    "q": file.filename.replace('.mp3', ''),
-                    "type": "track",
-                    "limit": 1
-                },
-                headers={"Authorization": f"Bearer {token}"}
-            )
-
-            if search_response.status_code != 200:
-                logger.error(f"Error searching for track: {search_response.text}")
-                response["error"] = f"Error searching for track: {search_response.text}"
-                return response
-
-            search_results = search_response.json()
-            tracks = search_results.get('tracks', {}).get('items', [])
+        return await process_upload(
+            SpotifyClient(token), file.filename, iter_upload_file(file),
+            playlist_id, add_to_liked, analyze
+        )
 
-            if not tracks:
-                response["error"] = "Could not find matching track on Spotify"
-                return response
-
-            track_uri = tracks[0]['uri']
-            response["track_uri"] = track_uri
-            response["track_name"] = tracks[0]['name']
-            response["artist_name"] = tracks[0]['artists'][0]['name']
-
-            # Add to playlist if specified
-            if playlist_id:
-                try:
-                    playlist_response = await client.post(
-                        f"{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks",
-                        json={"uris": [track_uri]},
-                        headers={
-                            "Authorization": f"Bearer {token}",
-                            "Content-Type": "application/json"
-                        }
-                    )
-                    
-                    if playlist_response.status_code == 201:
-                        playlist = await client.get(
-                            f"{SPOTIFY_API_BASE}/playlists/{playlist_id}",
-                            headers={"Authorization": f"Bearer {token}"}
-                        )
-                        if playlist.status_code == 200:
-                            playlist_data = playlist.json()
-                            response["playlist_name"] = playlist_data["name"]
-                            logger.info(f"Added to playlist: {playlist_data['name']}")
-                    else:
-                        logger.error(f"Error adding to playlist: {playlist_response.text}")
-                        response["error"] = f"Error adding to playlist: {playlist_response.text}"
-                except Exception as e:
-                    logger.error(f"Error adding to playlist: {str(e)}")
-                    response["error"] = f"Error adding to playlist: {str(e)}"
+    except Exception as e:
+        logger.error(f"Error uploading file: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        return {
+            "error": {
+                "status": 500,
+                "message": str(e)
+            }
+        }
 
-            # Add to liked songs if specified
-            if add_to_liked:
-                try:
-                    liked_response = await client.put(
-                        f"{SPOTIFY_API_BASE}/me/tracks",
-                        json={"ids": [track_uri.split(':')[-1]]},
-                        headers={
-                            "Authorization": f"Bearer {token}",
-                            "Content-Type": "application/json"
-                        }
-                    )
-                    
-                    if liked_response.status_code == 200:
-                        logger.info("Added to liked songs")
-                    else:
-                        logger.error(f"Error adding to liked songs: {liked_response.text}")
-                        response["error"] = f"Error adding to liked songs: {liked_response.text}"
-                except Exception as e:
-                    logger.error(f"Error adding to liked songs: {str(e)}")
-                    response["error"] = f"Error adding to liked songs: {str(e)}"
+@router.post("/stream")
+async def upload_track_stream(
+    request: Request,
+    filename: str,
+    playlist_id: Optional[str] = None,
+    add_to_liked: bool = False,
+    analyze: bool = False,
+    authorization: Optional[str] = Header(None),
+):
+    """Upload an MP3 sent as the raw request body, consumed as it arrives"""
+    try:
+        token = bearer_token(authorization)
 
-        # Clean up the file
-        os.remove(file_path)
+        if not filename.endswith('.mp3'):
+            raise HTTPException(status_code=400, detail="Only MP3 files are allowed")
+        # Refuse oversized bodies before reading any of them
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File is larger than {UPLOAD_MAX_BYTES} bytes")
 
-        return response
+        return await process_upload(
+            SpotifyClient(token), filename, iter_fixed_chunks(request.stream()),
+            playlist_id, add_to_liked, analyze
+        )
 
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
@@ -186,4 +339,111 @@ async def upload_track(
                 "status": 500,
                 "message": str(e)
             }
-        } 
\ No newline at end of file
+        }
+
+def batches(items: List[str], size: int) -> List[List[str]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+@router.post("/bulk")
+async def upload_tracks_bulk(
+    files: List[UploadFile] = File(...),
+    playlist_id: Optional[str] = Form(None),
+    add_to_liked: bool = Form(False),
+    authorization: Optional[str] = Header(None),
+):
+    """Import many MP3s at once and report the outcome per file.
+
+    Titles are searched concurrently (bounded), matches are added to the
+    playlist PLAYLIST_ITEMS_BATCH_SIZE URIs per request in upload order and
+    to liked songs SAVED_TRACKS_BATCH_SIZE IDs per request.
+    """
+    token = bearer_token(authorization)
+    client = SpotifyClient(token)
+    results = [{"filename": file.filename} for file in files]
+
+    # Hash every file and search each distinct title once
+    semaphore = asyncio.Semaphore(SPOTIFY_BATCH_CONCURRENCY)
+    searches: Dict[str, asyncio.Task] = {}
+
+    async def search(query: str) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await client.search_track(query)
+
+    async def resolve(file: UploadFile, result: Dict[str, Any]):
+        if not file.filename.endswith('.mp3'):
+            result["error"] = "Only MP3 files are allowed"
+            return
+        try:
+            received = await receive_upload(iter_upload_file(file))
+            result["size"] = received["size"]
+            result["sha256"] = received["sha256"]
+            query = file.filename[:-len('.mp3')]
+            if query not in searches:
+                searches[query] = asyncio.ensure_future(search(query))
+            track = await searches[query]
+        except HTTPException as e:
+            result["error"] = e.detail
+            return
+        except Exception as e:
+            result["error"] = f"Error searching for track: {str(e)}"
+            return
+        if track is None:
+            result["error"] = "Could not find matching track on Spotify"
+            return
+        result["track_uri"] = track["uri"]
+        result["track_name"] = track["name"]
+        result["artist_name"] = track["artists"][0]["name"]
+
+    await asyncio.gather(*(resolve(file, result) for file, result in zip(files, results)))
+    matched = [result for result in results if "track_uri" in result]
+    uris = list(dict.fromkeys(result["track_uri"] for result in matched))
+
+    # Playlist batches go in order so the playlist keeps the upload order
+    playlist_errors: Dict[str, str] = {}
+    if playlist_id and uris:
+        for batch in batches(uris, PLAYLIST_ITEMS_BATCH_SIZE):
+            try:
+                await client.add_playlist_items(playlist_id, batch)
+            except Exception as e:
+                logger.error(f"Error adding to playlist: {str(e)}")
+                playlist_errors.update({uri: f"Error adding to playlist: {str(e)}" for uri in batch})
+
+    liked_errors: Dict[str, str] = {}
+    if add_to_liked and uris:
+        uri_by_id = {uri.split(':')[-1]: uri for uri in uris}
+
+        async def save(batch: List[str]):
+            async with semaphore:
+                try:
+                    await client.save_tracks(batch)
+                except Exception as e:
+                    logger.error(f"Error adding to liked songs: {str(e)}")
+                    liked_errors.update({uri_by_id[track_id]: f"Error adding to liked songs: {str(e)}" for track_id in batch})
+        await asyncio.gather(*(save(batch) for batch in batches(list(uri_by_id), SAVED_TRACKS_BATCH_SIZE)))
+
+    for result in matched:
+        uri = result["track_uri"]
+        if playlist_id:
+            result["added_to_playlist"] = uri not in playlist_errors
+        if add_to_liked:
+            result["added_to_liked"] = uri not in liked_errors
+        errors = [errors[uri] for errors in (playlist_errors, liked_errors) if uri in errors]
+        if errors:
+            result["error"] = "; ".join(errors)
+
+    report = {
+        "results": results,
+        "summary": {
+            "files": len(results),
+            "matched": len(matched),
+            "added_to_playlist": sum(1 for result in matched if result.get("added_to_playlist")),
+            "added_to_liked": sum(1 for result in matched if result.get("added_to_liked")),
+        },
+        "playlist_id": playlist_id,
+    }
+    if playlist_id and len(playlist_errors) < len(uris):
+        try:
+            report["playlist_name"] = await get_playlist_name(client, playlist_id)
+        except Exception as e:
+            logger.error(f"Error fetching playlist name: {str(e)}")
+    return report
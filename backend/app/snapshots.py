@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Column, DateTime, JSON, String, select
+from .cache import TTLCache
+from .data_pipeline import FEATURE_COLUMNS
+from .database import Base, SessionLocal, ensure_db, upsert
+from .feature_store import feature_store
+from .projection import omit
+from .spotify_auth import token_ttl
+from .spotify_client import SpotifyClient
+
+logger = logging.getLogger(__name__)
+
+# Snapshots older than this are served once more while a refresh runs in the background
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "900"))
+# How often the scheduler looks for stale snapshots of recently active users
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "300"))
+# Snapshots kept in memory; each takes about 2 MB
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "100"))
+# Items captured per list; requests for up to this many are served from the snapshot
+SNAPSHOT_LIMIT = 50
+
+TIME_RANGES = ("short_term", "medium_term", "long_term")
+
+# Fields no endpoint returns, dropped before snapshots are cached and stored.
+# A track's and its album's market lists make up most of a raw snapshot.
+SNAPSHOT_OMITTED_FIELDS = frozenset({"available_markets"})
+
+class AnalyticsSnapshotRecord(Base):
+    __tablename__ = "analytics_snapshots"
+
+    user_id = Column(String(255), primary_key=True)
+    snapshot = Column(JSON, nullable=False)
+    built_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+def compute_etag(data: Any) -> str:
+    """Content hash of a JSON-serialisable value"""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+def feature_profile(tracks: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Mean audio features over the tracks that have them"""
+    features = [track["audio_features"] for track in tracks if track.get("audio_features")]
+    profile = {}
+    for column in FEATURE_COLUMNS:
+        values = [feature[column] for feature in features if feature.get(column) is not None]
+        if values:
+            profile[column] = sum(values) / len(values)
+    return profile
+
+def genre_distribution(artists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Share of the artists' genre tags taken by each genre, most common first"""
+    counts = Counter(genre for artist in artists for genre in artist.get("genres") or [])
+    total = sum(counts.values())
+    return [
+        {"genre": genre, "count": count, "share": count / total}
+        for genre, count in counts.most_common()
+    ]
+
+async def add_audio_features(sp: SpotifyClient, tracks: List[Dict[str, Any]]):
+    """Attach audio features to the tracks with one feature store lookup"""
+    features = await feature_store.get_many([track["id"] for track in tracks], sp.get_audio_features_by_id)
+    for track in tracks:
+        if track["id"] in features:
+            track["audio_features"] = features[track["id"]]
+
+def aggregates(tracks: List[Dict[str, Any]], artists: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "feature_profile": feature_profile(tracks),
+        "genre_distribution": genre_distribution(artists),
+    }
+
+async def build_snapshot(sp: SpotifyClient) -> Dict[str, Any]:
+    """Fetch and enrich everything the dashboard shows, for every time range.
+
+    A failed call only leaves its sections out (see fetch_section); the
+    build fails when every call does.
+    """
+    names = [f"top_tracks:{r}" for r in TIME_RANGES] + [f"top_artists:{r}" for r in TIME_RANGES] + ["recently_played"]
+    results = await asyncio.gather(
+        *(sp.get_top_tracks(time_range=r, limit=SNAPSHOT_LIMIT) for r in TIME_RANGES),
+        *(sp.get_top_artists(time_range=r, limit=SNAPSHOT_LIMIT) for r in TIME_RANGES),
+        sp.get_recently_played(limit=SNAPSHOT_LIMIT),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if len(errors) == len(results):
+        raise errors[0]
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Analytics snapshot built without {name}: {str(result)}")
+    sections: Dict[str, Any] = {
+        name: omit(result, SNAPSHOT_OMITTED_FIELDS)
+        for name, result in zip(names, results) if not isinstance(result, BaseException)
+    }
+
+    # One feature lookup for every track across all lists
+    tracks = [track for name, data in sections.items() if name.startswith("top_tracks:") for track in data]
+    tracks += [item["track"] for item in sections.get("recently_played", [])]
+    await add_audio_features(sp, tracks)
+
+    for time_range in TIME_RANGES:
+        top_tracks = sections.get(f"top_tracks:{time_range}")
+        top_artists = sections.get(f"top_artists:{time_range}")
+        if top_tracks is not None and top_artists is not None:
+            sections[f"aggregates:{time_range}"] = aggregates(top_tracks, top_artists)
+    return {
+        "built_at": time.time(),
+        "sections": {name: {"data": data, "etag": compute_etag(data)} for name, data in sections.items()},
+    }
+
+async def fetch_section(sp: SpotifyClient, name: str) -> Any:
+    """Fetch one snapshot section live, for snapshots built without it"""
+    kind, _, time_range = name.partition(":")
+    if kind == "recently_played":
+        recent = await sp.get_recently_played(limit=SNAPSHOT_LIMIT)
+        await add_audio_features(sp, [item["track"] for item in recent])
+        return recent
+    if kind == "top_tracks":
+        tracks = await sp.get_top_tracks(time_range=time_range, limit=SNAPSHOT_LIMIT)
+        await add_audio_features(sp, tracks)
+        return tracks
+    if kind == "top_artists":
+        return await sp.get_top_artists(time_range=time_range, limit=SNAPSHOT_LIMIT)
+    tracks, artists = await asyncio.gather(
+        fetch_section(sp, f"top_tracks:{time_range}"),
+        fetch_section(sp, f"top_artists:{time_range}")
+    )
+    return aggregates(tracks, artists)
+
+async def snapshot_sections(sp: SpotifyClient, snapshot: Dict[str, Any], names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """The named sections of a snapshot, fetching any it lacks live"""
+    sections = {name: snapshot["sections"][name] for name in names if name in snapshot["sections"]}
+    missing = [name for name in names if name not in sections]
+    fetched = await asyncio.gather(*(fetch_section(sp, name) for name in missing))
+    for name, data in zip(missing, fetched):
+        data = omit(data, SNAPSHOT_OMITTED_FIELDS)
+        sections[name] = {"data": data, "etag": compute_etag(data)}
+    return sections
+
+class SnapshotService:
+    """Per-user analytics snapshots: memory LRU -> database -> rebuilt from Spotify.
+
+    Stale snapshots are still served while a background refresh replaces
+    them, and a scheduler keeps the snapshots of recently active users warm.
+    """
+    def __init__(self, memory_size: int = SNAPSHOT_CACHE_SIZE):
+        self.memory = TTLCache(max_size=memory_size, ttl=float("inf"))
+        # Access tokens of recently active users, never persisted, kept only while valid
+        self.tokens = TTLCache(max_size=10000, ttl=3600)
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._scheduler: Optional[asyncio.Task] = None
+        self.served_fresh = 0
+        self.served_stale = 0
+        self.builds = 0
+        self.build_failures = 0
+
+    def _load_from_db(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ensure_db()
+        with SessionLocal() as session:
+            return session.execute(
+                select(AnalyticsSnapshotRecord.snapshot).where(AnalyticsSnapshotRecord.user_id == user_id)
+            ).scalar_one_or_none()
+
+    def _save_to_db(self, user_id: str, snapshot: Dict[str, Any]):
+        ensure_db()
+        row = {"user_id": user_id, "snapshot": snapshot, "built_at": datetime.utcfromtimestamp(snapshot["built_at"])}
+        with SessionLocal() as session:
+            upsert(session, AnalyticsSnapshotRecord, [row], update_columns=["snapshot", "built_at"])
+            session.commit()
+
+    async def _build(self, user_id: str, token: str) -> Dict[str, Any]:
+        snapshot = await build_snapshot(SpotifyClient(token))
+        self.builds += 1
+        self.memory.set(user_id, snapshot)
+        try:
+            await asyncio.to_thread(self._save_to_db, user_id, snapshot)
+        except Exception as e:
+            logger.error(f"Error writing analytics snapshot: {str(e)}")
+        return snapshot
+
+    def refresh(self, user_id: str, token: str) -> asyncio.Task:
+        """Rebuild a user's snapshot in the background, at most once at a time"""
+        task = self._refreshing.get(user_id)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(self._build(user_id, token))
+        self._refreshing[user_id] = task
+
+        def finished(task: asyncio.Task):
+            self._refreshing.pop(user_id, None)
+            if not task.cancelled() and task.exception() is not None:
+                self.build_failures += 1
+                logger.error(f"Error building analytics snapshot: {str(task.exception())}")
+        task.add_done_callback(finished)
+        return task
+
+    async def get(self, user_id: str, token: str) -> Dict[str, Any]:
+        """The user's snapshot, building it on first use and refreshing it when stale"""
+        self.tokens.set(user_id, token, ttl=token_ttl(token))
+        snapshot = self.memory.get(user_id)
+        if snapshot is None:
+            try:
+                snapshot = await asyncio.to_thread(self._load_from_db, user_id)
+            except Exception as e:
+                logger.error(f"Error reading analytics snapshot: {str(e)}")
+            if snapshot is not None:
+                self.memory.set(user_id, snapshot)
+        if snapshot is None:
+            return await asyncio.shield(self.refresh(user_id, token))
+
+        if time.time() - snapshot["built_at"] > SNAPSHOT_MAX_AGE:
+            self.served_stale += 1
+            self.refresh(user_id, token)
+        else:
+            self.served_fresh += 1
+        return snapshot
+
+    async def _refresh_stale(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_REFRESH_INTERVAL)
+            for user_id, token in self.tokens.items():
+                snapshot = self.memory.get(user_id)
+                if snapshot is None or time.time() - snapshot["built_at"] > SNAPSHOT_MAX_AGE:
+                    self.refresh(user_id, token)
+
+    def start(self):
+        """Start the background refresh scheduler"""
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._refresh_stale())
+
+    async def stop(self):
+        tasks = list(self._refreshing.values())
+        if self._scheduler is not None:
+            tasks.append(self._scheduler)
+            self._scheduler = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.served_fresh + self.served_stale
+        return {
+            "memory_size": len(self.memory),
+            "served_fresh": self.served_fresh,
+            "served_stale": self.served_stale,
+            "stale_ratio": self.served_stale / served if served else 0.0,
+            "builds": self.builds,
+            "build_failures": self.build_failures,
+            "refreshing": len(self._refreshing),
+        }
+
+snapshot_service = SnapshotService()
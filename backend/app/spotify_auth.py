@@ -1,15 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordBearer
-import requests
 import os
 from typing import Optional
 from datetime import datetime, timedelta
 import json
 from dotenv import load_dotenv
-from spotipy import Spotify
-from spotipy.oauth2 import SpotifyOAuth
+from .spotify_client import SpotifyClient, SpotifyAPIError, request_token
+from .cache import TTLCache, hash_token
 import logging
+import time
 import traceback
 
 load_dotenv()
@@ -23,8 +23,6 @@ SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 
 # Spotify API endpoints
 SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
-SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
-SPOTIFY_API_BASE_URL = "https://api.spotify.com/v1"
 
 # Scopes for Spotify API access
 SCOPES = [
@@ -45,6 +43,31 @@ SCOPES = [
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Profiles resolved from bearer tokens, keyed by token hash. Entries never
+# outlive the token itself (Spotify access tokens last an hour).
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "3600"))
+# Tokens issued by another process (or before a restart) have no known
+# expiry, so their profiles are only trusted this long before re-checking
+USER_CACHE_UNKNOWN_TTL = float(os.getenv("USER_CACHE_UNKNOWN_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+user_cache = TTLCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_token_expiry = TTLCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def remember_token_expiry(access_token: str, expires_in: Optional[float]):
+    """Record when a token issued by the accounts service stops being valid"""
+    if expires_in:
+        _token_expiry.set(hash_token(access_token), time.monotonic() + float(expires_in), ttl=float(expires_in))
+
+def _user_cache_ttl(token_key: str) -> float:
+    expires_at = _token_expiry.get(token_key)
+    if expires_at is None:
+        return min(USER_CACHE_TTL, USER_CACHE_UNKNOWN_TTL)
+    return min(USER_CACHE_TTL, expires_at - time.monotonic())
+
+def token_ttl(access_token: str) -> float:
+    """Seconds an access token can still be relied on"""
+    return _user_cache_ttl(hash_token(access_token))
+
 def get_spotify_auth_url():
     """Generate Spotify authorization URL"""
     params = {
@@ -88,27 +111,27 @@ async def callback(code: str):
         }
         
         print(f"Making token request with data: {token_data}")  # Debug log
-        response = requests.post(SPOTIFY_TOKEN_URL, data=token_data)
+        try:
+            tokens = await request_token(token_data)
+        except SpotifyAPIError as e:
+            print(f"Token request failed with status {e.status_code}")
+            print(f"Response: {e.message}")
+            raise HTTPException(status_code=400, detail=f"Token request failed: {e.message}")
         
-        if response.status_code != 200:
-            print(f"Token request failed with status {response.status_code}")
-            print(f"Response: {response.text}")
-            raise HTTPException(status_code=400, detail=f"Token request failed: {response.text}")
-        
-        tokens = response.json()
         print(f"Received tokens: {tokens}")  # Debug log
+        remember_token_expiry(tokens["access_token"], tokens.get("expires_in"))
         
         # Get user profile
-        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
-        user_response = requests.get(f"{SPOTIFY_API_BASE_URL}/me", headers=headers)
-        
-        if user_response.status_code != 200:
-            print(f"User profile request failed with status {user_response.status_code}")
-            print(f"Response: {user_response.text}")
-            raise HTTPException(status_code=400, detail=f"User profile request failed: {user_response.text}")
+        try:
+            user_data = await SpotifyClient(tokens["access_token"]).current_user()
+        except SpotifyAPIError as e:
+            print(f"User profile request failed with status {e.status_code}")
+            print(f"Response: {e.message}")
+            raise HTTPException(status_code=400, detail=f"User profile request failed: {e.message}")
         
-        user_data = user_response.json()
         print(f"Received user data: {user_data}")  # Debug log
+        token_key = hash_token(tokens["access_token"])
+        user_cache.set(token_key, user_data, ttl=_user_cache_ttl(token_key))
         
         # Return both access token and refresh token
         return {
@@ -118,9 +141,8 @@ async def callback(code: str):
             "user": user_data
         }
         
-    except requests.exceptions.RequestException as e:
-        print(f"Error in callback: {str(e)}")  # Debug log
-        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Unexpected error in callback: {str(e)}")  # Debug log
         raise HTTPException(status_code=400, detail=str(e))
@@ -136,12 +158,11 @@ async def refresh_token(refresh_token: str):
             "client_secret": SPOTIFY_CLIENT_SECRET
         }
         
-        response = requests.post(SPOTIFY_TOKEN_URL, data=token_data)
-        response.raise_for_status()
+        tokens = await request_token(token_data)
+        remember_token_expiry(tokens["access_token"], tokens.get("expires_in"))
+        return tokens
         
-        return response.json()
-        
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 def get_spotify_headers(access_token: str):
@@ -153,6 +174,8 @@ def get_spotify_headers(access_token: str):
 
 def get_spotify_client():
     """Create and return a Spotify client instance"""
+    # spotipy is only needed here, so it is not imported at startup
+    from spotipy.oauth2 import SpotifyOAuth
     return SpotifyOAuth(
         client_id=SPOTIFY_CLIENT_ID,
         client_secret=SPOTIFY_CLIENT_SECRET,
@@ -166,16 +189,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         # Log token for debugging (first 10 chars only)
         logging.info(f"Received token: {token[:10]}...")
         
-        # Create Spotify client
-        sp = Spotify(auth=token)
-        
-        # Get user profile
-        user = sp.current_user()
-        
-        # Add the access token to the user data
-        user["access_token"] = token
+        # Get user profile, at most once per token lifetime
+        token_key = hash_token(token)
+        profile = await user_cache.get_or_load(
+            token_key,
+            SpotifyClient(token).current_user,
+            ttl=_user_cache_ttl(token_key)
+        )
         
-        return user
+        # Add the access token to a copy of the cached profile
+        return {**profile, "access_token": token}
     except Exception as e:
         logging.error(f"Error in get_current_user: {str(e)}")
         logging.error(f"Full traceback: {traceback.format_exc()}")
@@ -185,10 +208,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_spotify_api_client(token: str):
+def get_spotify_api_client(token: str) -> SpotifyClient:
     """Create a Spotify API client with the given token"""
     try:
-        return Spotify(auth=token)
+        return SpotifyClient(token)
     except Exception as e:
         logging.error(f"Error creating Spotify client: {str(e)}")
         raise HTTPException(
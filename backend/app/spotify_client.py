@@ -0,0 +1,259 @@
+import asyncio
+import httpx
+import importlib.util
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from .cache import hash_token
+from .metrics import spotify_endpoint, spotify_request_duration, spotify_requests
+from .rate_limiter import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Spotify API endpoints (overridable to point at a stand-in such as benchmarks.spotify_stub)
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+SPOTIFY_API_BASE_URL = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1")
+
+# Connection pool settings shared by all outbound Spotify traffic
+SPOTIFY_HTTP_MAX_CONNECTIONS = int(os.getenv("SPOTIFY_HTTP_MAX_CONNECTIONS", "100"))
+SPOTIFY_HTTP_MAX_KEEPALIVE = int(os.getenv("SPOTIFY_HTTP_MAX_KEEPALIVE", "20"))
+SPOTIFY_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("SPOTIFY_HTTP_KEEPALIVE_EXPIRY", "30"))
+SPOTIFY_HTTP_TIMEOUT = float(os.getenv("SPOTIFY_HTTP_TIMEOUT", "10"))
+SPOTIFY_HTTP2 = os.getenv("SPOTIFY_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Largest ID list accepted by GET /audio-features, and how many batches may be in flight
+AUDIO_FEATURES_BATCH_SIZE = 100
+PLAYLIST_ITEMS_BATCH_SIZE = 100
+SAVED_TRACKS_BATCH_SIZE = 50
+SPOTIFY_BATCH_CONCURRENCY = int(os.getenv("SPOTIFY_BATCH_CONCURRENCY", "8"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+_pool_stats = {
+    "requests_total": 0,
+    "in_flight": 0,
+    "peak_in_flight": 0,
+}
+
+class SpotifyAPIError(Exception):
+    """Error returned by the Spotify Web API or accounts service"""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Spotify API error {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+def _create_http_client() -> httpx.AsyncClient:
+    http2 = SPOTIFY_HTTP2 and importlib.util.find_spec("h2") is not None
+    if SPOTIFY_HTTP2 and not http2:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+    logger.info(f"Opening Spotify HTTP pool (max_connections={SPOTIFY_HTTP_MAX_CONNECTIONS}, http2={http2})")
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=SPOTIFY_HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=SPOTIFY_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=SPOTIFY_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=SPOTIFY_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+async def open_http_client() -> httpx.AsyncClient:
+    """Create the process-wide connection pool (called from the app lifespan)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _create_http_client()
+    return _http_client
+
+async def close_http_client():
+    """Close the process-wide connection pool"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Closed Spotify HTTP pool")
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared connection pool, creating it lazily outside the app lifespan"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _create_http_client()
+    return _http_client
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Report connection pool utilisation"""
+    stats = {
+        **_pool_stats,
+        "max_connections": SPOTIFY_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": SPOTIFY_HTTP_MAX_KEEPALIVE,
+        "open": _http_client is not None and not _http_client.is_closed,
+    }
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    stats["connections"] = len(connections)
+    stats["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+    stats["http2_connections"] = sum(1 for conn in connections if "HTTP/2" in conn.info())
+    return stats
+
+async def _send(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a single HTTP request over the shared pool without blocking the event loop"""
+    client = get_http_client()
+    _pool_stats["requests_total"] += 1
+    _pool_stats["in_flight"] += 1
+    _pool_stats["peak_in_flight"] = max(_pool_stats["peak_in_flight"], _pool_stats["in_flight"])
+    endpoint = spotify_endpoint(httpx.URL(url).path)
+    status = "error"
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        _pool_stats["in_flight"] -= 1
+        spotify_request_duration.observe(time.perf_counter() - start, method, endpoint)
+        spotify_requests.inc(method, endpoint, status)
+
+async def send(method: str, url: str, user_key: Optional[str] = None, **kwargs) -> httpx.Response:
+    """Send a request through the rate-limit scheduler and the shared pool"""
+    return await scheduler.send(_send, method, url, user_key=user_key, **kwargs)
+
+def _raise_for_status(response: httpx.Response):
+    """Raise SpotifyAPIError for any non-2xx response"""
+    if response.is_success:
+        return
+    try:
+        error = response.json().get("error", response.text)
+        message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+    except ValueError:
+        message = response.text
+    raise SpotifyAPIError(response.status_code, message)
+
+async def request_token(token_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Exchange an authorization code or refresh token at the accounts service"""
+    response = await send("POST", SPOTIFY_TOKEN_URL, data=token_data)
+    _raise_for_status(response)
+    return response.json()
+
+async def fetch_in_batches(
+    ids: List[str],
+    fetch_batch: Callable[[List[str]], Awaitable[List[Optional[Dict[str, Any]]]]],
+    batch_size: int,
+    concurrency: int = SPOTIFY_BATCH_CONCURRENCY
+) -> Dict[str, Dict[str, Any]]:
+    """Fetch objects for deduplicated IDs in full-size concurrent batches, keyed by ID.
+
+    A failing batch is logged and skipped so the remaining batches still return.
+    """
+    unique_ids = list(dict.fromkeys(i for i in ids if i))
+    batches = [unique_ids[i:i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(batch: List[str]) -> List[Optional[Dict[str, Any]]]:
+        async with semaphore:
+            try:
+                return await fetch_batch(batch)
+            except Exception as e:
+                logger.error(f"Error fetching batch of {len(batch)} IDs: {str(e)}")
+                return []
+
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+    return {item["id"]: item for items in results for item in items if item}
+
+class SpotifyClient:
+    """Non-blocking Spotify Web API client bound to a single access token"""
+    def __init__(self, token: str):
+        self.token = token
+        self.user_key = hash_token(token)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Call a Spotify API path (or absolute URL) and return the raw response"""
+        url = path if path.startswith("http") else f"{SPOTIFY_API_BASE_URL}{path}"
+        return await send(method, url, user_key=self.user_key, headers=self.headers, **kwargs)
+
+    async def request(self, method: str, path: str, **kwargs) -> Any:
+        """Call a Spotify API path (or absolute URL) and return the decoded body"""
+        response = await self.send(method, path, **kwargs)
+        _raise_for_status(response)
+        if not response.content:
+            return None
+        return response.json()
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self.request("GET", path, params=params)
+
+    async def current_user(self) -> Dict[str, Any]:
+        """Get the profile of the token's owner"""
+        return await self.get("/me")
+
+    async def get_top_tracks(self, time_range: str = "medium_term", limit: int = 20) -> List[Dict[str, Any]]:
+        """Get user's top tracks"""
+        tracks = await self.get("/me/top/tracks", {"time_range": time_range, "limit": limit})
+        return tracks["items"]
+
+    async def get_top_artists(self, time_range: str = "medium_term", limit: int = 20) -> List[Dict[str, Any]]:
+        """Get user's top artists"""
+        artists = await self.get("/me/top/artists", {"time_range": time_range, "limit": limit})
+        return artists["items"]
+
+    async def _get_audio_features_batch(self, track_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        features = await self.get("/audio-features", {"ids": ",".join(track_ids)})
+        return features["audio_features"]
+
+    async def get_audio_features_by_id(self, track_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get audio features for any number of tracks, keyed by track ID"""
+        return await fetch_in_batches(track_ids, self._get_audio_features_batch, AUDIO_FEATURES_BATCH_SIZE)
+
+    async def get_audio_features(self, track_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Get audio features for tracks, aligned with track_ids (None where unavailable)"""
+        features = await self.get_audio_features_by_id(track_ids)
+        return [features.get(track_id) for track_id in track_ids]
+
+    async def get_recently_played(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get user's recently played tracks"""
+        recent = await self.get("/me/player/recently-played", {"limit": limit})
+        return recent["items"]
+
+    async def get_playlists(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get user's playlists"""
+        playlists = await self.get("/me/playlists", {"limit": limit})
+        return playlists["items"]
+
+    async def playlist(self, playlist_id: str, fields: Optional[str] = None) -> Dict[str, Any]:
+        """Get a playlist, optionally only the given fields"""
+        return await self.get(f"/playlists/{playlist_id}", {"fields": fields} if fields else None)
+
+    async def add_playlist_items(self, playlist_id: str, uris: List[str]) -> Dict[str, Any]:
+        """Append up to PLAYLIST_ITEMS_BATCH_SIZE track URIs to a playlist"""
+        return await self.request("POST", f"/playlists/{playlist_id}/tracks", json={"uris": uris})
+
+    async def save_tracks(self, track_ids: List[str]):
+        """Add up to SAVED_TRACKS_BATCH_SIZE tracks to the user's liked songs"""
+        await self.request("PUT", "/me/tracks", json={"ids": track_ids})
+
+    async def search_track(self, query: str) -> Optional[Dict[str, Any]]:
+        """Best matching track for a search query, if any"""
+        results = await self.get("/search", {"q": query, "type": "track", "limit": 1})
+        items = results.get("tracks", {}).get("items", [])
+        return items[0] if items else None
+
+    async def track(self, track_id: str) -> Dict[str, Any]:
+        """Get a single track"""
+        return await self.get(f"/tracks/{track_id}")
+
+    async def recommendations(
+        self,
+        seed_tracks: Optional[List[str]] = None,
+        seed_artists: Optional[List[str]] = None,
+        limit: int = 20,
+        **params
+    ) -> Dict[str, Any]:
+        """Get recommendations for the given seeds"""
+        query = {"limit": limit, **params}
+        if seed_tracks:
+            query["seed_tracks"] = ",".join(seed_tracks)
+        if seed_artists:
+            query["seed_artists"] = ",".join(seed_artists)
+        return await self.get("/recommendations", query)
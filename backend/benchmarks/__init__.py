@@ -0,0 +1,2 @@
+"""Performance benchmarks for the backend. Run modules from the backend directory,
+e.g. ``python -m benchmarks.bench_process_track_data``."""
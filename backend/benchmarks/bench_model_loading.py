@@ -0,0 +1,58 @@
+"""Load time and per-process heap of a persisted MusicRecommender: a whole-object
+joblib pickle against the memory-mapped feature file written by save_model."""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+import joblib
+import numpy as np
+from app.ml_model import MusicRecommender, load_model, save_model
+from benchmarks.bench_similarity_index import make_catalogue
+
+def measure(load, seeds):
+    gc.collect()
+    start = time.perf_counter()
+    model = load()
+    loaded = time.perf_counter() - start
+    model.get_recommendations(seeds[0], 10)
+    first_query = time.perf_counter() - start
+    del model
+
+    # Heap is measured on a second load since tracing slows loading down
+    gc.collect()
+    tracemalloc.start()
+    model = load()
+    model.get_recommendations(seeds[0], 10)
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return loaded, first_query, heap
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--clusters", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'tracks':>9} {'format':>8} {'load ms':>9} {'1st query ms':>13} {'heap MB':>9}")
+    for n in args.sizes:
+        df = make_catalogue(n)
+        df["name"] = [f"Track {i}" for i in range(n)]
+        df["artist"] = [f"Artist {i % 5000}" for i in range(n)]
+        recommender = MusicRecommender()
+        recommender.train_model(df, n_clusters=args.clusters)
+        seeds = np.random.default_rng(1).choice(df["id"].to_numpy(), 10, replace=False)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            pickle_path = os.path.join(tmp, "pickle.joblib")
+            joblib.dump(recommender, pickle_path)
+            mapped_path = os.path.join(tmp, "mapped.joblib")
+            save_model(recommender, mapped_path)
+            del recommender
+            for label, load in (("joblib", lambda: joblib.load(pickle_path)), ("mmap", lambda: load_model(mapped_path))):
+                loaded, first_query, heap = measure(load, seeds)
+                print(f"{n:>9} {label:>8} {loaded * 1e3:>9.1f} {first_query * 1e3:>13.1f} {heap / 2 ** 20:>9.1f}")
+
+if __name__ == "__main__":
+    main()
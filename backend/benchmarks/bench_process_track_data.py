@@ -0,0 +1,74 @@
+"""Compare the columnar process_track_data with the previous per-track dict loop."""
+import argparse
+import random
+import time
+from typing import Any, Dict, List
+import pandas as pd
+from app.data_pipeline import process_track_data, FEATURE_COLUMNS
+
+def process_track_data_rowwise(tracks: List[Dict[str, Any]], features: List[Dict[str, Any]]) -> pd.DataFrame:
+    """The original implementation: one dict per track, then a DataFrame from records"""
+    features_dict = {f["id"]: f for f in features if f is not None}
+    processed_data = []
+    for track in tracks:
+        track_id = track["id"]
+        if track_id in features_dict:
+            track_data = {
+                "id": track_id,
+                "name": track["name"],
+                "artist": track["artists"][0]["name"],
+                "popularity": track["popularity"],
+                "duration_ms": track["duration_ms"],
+            }
+            for column in FEATURE_COLUMNS:
+                track_data[column] = features_dict[track_id][column]
+            processed_data.append(track_data)
+    return pd.DataFrame(processed_data)
+
+def make_tracks(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    tracks, features = [], []
+    for i in range(n):
+        track_id = f"track{i:017d}"
+        tracks.append({
+            "id": track_id,
+            "name": f"Track {i}",
+            "artists": [{"name": f"Artist {i % 997}"}],
+            "popularity": rng.randint(0, 100),
+            "duration_ms": rng.randint(60_000, 600_000),
+        })
+        # Roughly 2% of tracks have no audio features
+        if rng.random() < 0.02:
+            features.append(None)
+            continue
+        feature = {column: rng.random() for column in FEATURE_COLUMNS}
+        feature.update(id=track_id, key=rng.randint(0, 11), mode=rng.randint(0, 1),
+                       loudness=rng.uniform(-40, 0), tempo=rng.uniform(60, 200))
+        features.append(feature)
+    return tracks, features
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'tracks':>8} {'rowwise ms':>11} {'columnar ms':>12} {'speedup':>8} {'rowwise MB':>11} {'columnar MB':>12}")
+    for n in args.sizes:
+        tracks, features = make_tracks(n)
+        old = best_of(lambda: process_track_data_rowwise(tracks, features), args.repeat)
+        new = best_of(lambda: process_track_data(tracks, features), args.repeat)
+        old_mb = process_track_data_rowwise(tracks, features).memory_usage(deep=True).sum() / 1e6
+        new_mb = process_track_data(tracks, features).memory_usage(deep=True).sum() / 1e6
+        print(f"{n:>8} {old * 1e3:>11.1f} {new * 1e3:>12.1f} {old / new:>7.1f}x {old_mb:>11.1f} {new_mb:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Latency and recall of MusicRecommender's cluster index against an exact scan."""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from app.ml_model import MusicRecommender
+
+def make_catalogue(n: int, n_centers: int = 40, seed: int = 0) -> pd.DataFrame:
+    """Synthetic tracks drawn around a few dozen 'genres' so clusters are meaningful"""
+    rng = np.random.default_rng(seed)
+    recommender = MusicRecommender()
+    centers = rng.normal(size=(n_centers, len(recommender.feature_columns)))
+    features = centers[rng.integers(0, n_centers, n)] + rng.normal(scale=0.6, size=(n, len(recommender.feature_columns)))
+    df = pd.DataFrame(features.astype(np.float32), columns=recommender.feature_columns)
+    df.insert(0, "id", [f"t{i}" for i in range(n)])
+    return df
+
+def query_ids(recommender: MusicRecommender, track_ids, k: int, **kwargs):
+    timings, results = [], []
+    for track_id in track_ids:
+        start = time.perf_counter()
+        recs = recommender.get_recommendations(track_id, k, **kwargs)
+        timings.append(time.perf_counter() - start)
+        results.append({r["id"] for r in recs})
+    return np.array(timings), results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        df = make_catalogue(n)
+        recommender = MusicRecommender()
+        start = time.perf_counter()
+        recommender.train_model(df, n_clusters=args.clusters)
+        print(f"\n{n} tracks, {args.clusters} clusters (train + index {time.perf_counter() - start:.1f}s)")
+
+        seeds = np.random.default_rng(1).choice(df["id"].to_numpy(), args.queries, replace=False)
+        exact_times, exact = query_ids(recommender, seeds, args.k, exact=True)
+        print(f"{'mode':>10} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>10}")
+        print(f"{'exact':>10} {np.percentile(exact_times, 50) * 1e3:>8.2f} {np.percentile(exact_times, 99) * 1e3:>8.2f} {1.0:>10.3f}")
+        for n_probe in (1, 2, 3):
+            if n_probe > args.clusters:
+                break
+            times, found = query_ids(recommender, seeds, args.k, n_probe=n_probe)
+            recall = np.mean([len(a & b) / len(b) for a, b in zip(found, exact)])
+            print(f"{'probe=' + str(n_probe):>10} {np.percentile(times, 50) * 1e3:>8.2f} {np.percentile(times, 99) * 1e3:>8.2f} {recall:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Train time vs. library size for full, warm-start and incremental training."""
+import argparse
+import copy
+import os
+import tempfile
+import time
+from app.ml_model import MusicRecommender, save_model
+from benchmarks.bench_similarity_index import make_catalogue
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--new-fraction", type=float, default=0.01,
+                        help="share of the library added after the initial fit")
+    parser.add_argument("--clusters", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        print(f"{'tracks':>8} {'new':>6} {'full s':>8} {'warm s':>8} {'incremental ms':>15} {'save ms':>8}")
+        for n in args.sizes:
+            n_new = max(1, int(n * args.new_fraction))
+            catalogue = make_catalogue(n + n_new)
+            initial, added = catalogue.iloc[:n], catalogue.iloc[n:]
+
+            base = MusicRecommender()
+            base.train_model(initial, n_clusters=args.clusters)
+
+            full = timed(lambda: MusicRecommender().train_model(catalogue, n_clusters=args.clusters))
+            warm_model = copy.deepcopy(base)
+            warm = timed(lambda: warm_model.train_model(catalogue, n_clusters=args.clusters, warm_start=True))
+            incremental_model = copy.deepcopy(base)
+            incremental = timed(lambda: incremental_model.update_model(added))
+            saved = timed(lambda: save_model(incremental_model, os.path.join(model_dir, f"model_{n}.joblib")))
+            print(f"{n:>8} {n_new:>6} {full:>8.3f} {warm:>8.3f} {incremental * 1e3:>15.1f} {saved * 1e3:>8.1f}")
+    print("\nAn incremental update still rebuilds the whole similarity index and the save")
+    print("rewrites the whole feature file: partial_fit rescales every stored row, and")
+    print("cells are contiguous in the file, so new rows cannot simply be appended.")
+
+if __name__ == "__main__":
+    main()
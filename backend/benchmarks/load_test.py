@@ -0,0 +1,295 @@
+"""Fixed-concurrency load test of the backend against the local Spotify stub.
+
+Starts benchmarks.spotify_stub and the backend (uvicorn app.main:app, with
+SPOTIFY_API_BASE_URL pointing at the stub and a throwaway database, model
+and upload directory), then drives each scenario for a fixed time with a
+fixed number of concurrent clients and reports RPS, p50/p90/p99 latency,
+errors and upstream (stub) requests per backend request.
+
+Results are compared with a stored baseline when one exists, so a change can
+be checked against the numbers recorded before it on the same machine:
+
+    python -m benchmarks.load_test --save-baseline benchmarks/results/baseline.json
+    # ...make a change...
+    python -m benchmarks.load_test --max-regression 0.1
+
+Use --target to load an already running backend instead (it must already be
+configured to use the stub, e.g. via --stub-url).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, List, Optional
+import httpx
+import numpy as np
+from app.data_pipeline import FEATURE_COLUMNS
+from benchmarks.spotify_stub import make_audio_features, track_id
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "results", "baseline.json")
+
+# Tracks each simulated user trains on; ML seeds are drawn from these
+TRAINING_TRACKS = 2000
+UPLOAD_BODY = b"\xff\xfb\x90\x00" + bytes(64 * 1024 - 4)
+
+Request = Dict[str, Any]
+
+def training_rows(n: int, offset: int = 0) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(offset, offset + n):
+        features = make_audio_features(i)
+        rows.append({
+            "id": track_id(i),
+            "name": f"Track {i}",
+            "artist": f"Artist {i % 500}",
+            **{column: features[column] for column in FEATURE_COLUMNS},
+        })
+    return rows
+
+def popular_track(rng: random.Random, n: int = TRAINING_TRACKS) -> str:
+    """A seed track drawn from a heavy-tailed distribution, so some seeds are hot"""
+    return track_id(int(rng.paretovariate(1.2) - 1) % n)
+
+TRAIN_BODY = training_rows(500)
+
+SCENARIOS: Dict[str, Callable[[random.Random], Request]] = {
+    "analysis.top-tracks": lambda rng: {"method": "GET", "url": "/analysis/top-tracks", "params": {"limit": 20}},
+    "analysis.recently-played": lambda rng: {"method": "GET", "url": "/analysis/recently-played"},
+    "analysis.dashboard": lambda rng: {"method": "GET", "url": "/analysis/dashboard"},
+    "recommendations.similar-tracks": lambda rng: {
+        "method": "GET", "url": "/recommendations/similar-tracks",
+        "params": {"track_id": popular_track(rng), "limit": 20},
+    },
+    "upload.stream": lambda rng: {
+        "method": "POST", "url": "/upload/stream", "content": UPLOAD_BODY,
+        "params": {"filename": f"Track {rng.randrange(5000)}.mp3", "playlist_id": "stubplaylistbench", "add_to_liked": "true"},
+    },
+    "ml.recommendations": lambda rng: {
+        "method": "GET", "url": f"/ml/recommendations/{popular_track(rng)}", "params": {"n_recommendations": 10},
+    },
+    "ml.batch": lambda rng: {
+        "method": "POST", "url": "/ml/recommendations/batch",
+        "json": {"track_ids": [popular_track(rng) for _ in range(20)], "n_recommendations": 10},
+    },
+    "ml.train": lambda rng: {"method": "POST", "url": "/ml/train", "params": {"n_clusters": 8}, "json": TRAIN_BODY},
+}
+# Scenarios that need every simulated user to have a trained model first
+NEEDS_MODEL = {"ml.recommendations", "ml.batch"}
+
+def auth(user: int) -> Dict[str, str]:
+    return {"Authorization": f"Bearer bench-user-{user}"}
+
+async def upstream_requests(stub_url: Optional[str]) -> Optional[int]:
+    if stub_url is None:
+        return None
+    async with httpx.AsyncClient() as client:
+        counts = (await client.get(f"{stub_url}/stub/stats")).json()
+    return sum(count for key, count in counts.items() if key.startswith(("GET /v1", "POST /v1", "PUT /v1")))
+
+async def train_users(client: httpx.AsyncClient, users: int):
+    for user in range(users):
+        response = await client.post(
+            "/ml/train", params={"n_clusters": 8}, json=training_rows(TRAINING_TRACKS), headers=auth(user), timeout=300
+        )
+        response.raise_for_status()
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    build: Callable[[random.Random], Request],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    users: int,
+    stub_url: Optional[str]
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sent = 0
+    upstream_before = await upstream_requests(stub_url)
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + duration
+
+    async def worker(n: int):
+        nonlocal sent
+        rng = random.Random(n)
+        headers = auth(n % users)
+        while time.perf_counter() < deadline:
+            request = build(rng)
+            start = time.perf_counter()
+            try:
+                status = (await client.request(headers=headers, **request)).status_code
+            except httpx.HTTPError:
+                status = "error"
+            sent += 1
+            if start >= measure_from:
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = max(time.perf_counter() - measure_from, 1e-9)
+    upstream_after = await upstream_requests(stub_url)
+
+    timings = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    errors = sum(count for status, count in statuses.items() if status == "error" or status >= 400)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p90_ms": float(np.percentile(timings, 90)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "max_ms": float(timings.max()),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "upstream_per_request": (upstream_after - upstream_before) / sent if upstream_before is not None and sent else None,
+    }
+
+def wait_until_ready(url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with status {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+@contextmanager
+def serve(command: List[str], ready_url: str, env: Dict[str, str], cwd: str):
+    proc = subprocess.Popen(command, env=env, cwd=cwd)
+    try:
+        wait_until_ready(ready_url, proc)
+        yield
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def start_servers(stack: ExitStack, args) -> Dict[str, str]:
+    """Start the stub and the backend as subprocesses; returns their base URLs"""
+    workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="spotify-bench-"))
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stack.enter_context(serve(
+        [sys.executable, "-m", "benchmarks.spotify_stub", "--port", str(args.stub_port),
+         "--latency", str(args.latency), "--jitter", str(args.jitter),
+         "--rate-limit-ratio", str(args.rate_limit_ratio), "--retry-after", str(args.retry_after)],
+        f"{stub_url}/stub/stats", env, BACKEND_DIR
+    ))
+
+    backend_env = {
+        **env,
+        "SPOTIFY_API_BASE_URL": f"{stub_url}/v1",
+        "SPOTIFY_TOKEN_URL": f"{stub_url}/api/token",
+        "SPOTIFY_HTTP2": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "MODEL_DIR": os.path.join(workdir, "models"),
+    }
+    if not args.keep_rate_limits:
+        # Measure the backend, not the outbound throttle that mirrors Spotify's quotas
+        for name in ("SPOTIFY_APP_RATE", "SPOTIFY_APP_BURST", "SPOTIFY_USER_RATE", "SPOTIFY_USER_BURST"):
+            backend_env[name] = "1000000"
+    backend_url = f"http://127.0.0.1:{args.port}"
+    stack.enter_context(serve(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        f"{backend_url}/metrics", backend_env, workdir
+    ))
+    return {"backend": backend_url, "stub": stub_url}
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], max_regression: Optional[float]) -> bool:
+    """Print changes against the baseline; False when a scenario regressed past max_regression"""
+    ok = True
+    print(f"\nagainst baseline ({baseline.get('recorded_at', 'unknown date')}):")
+    print(f"{'scenario':<32} {'rps':>9} {'p50':>9} {'p99':>9}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<32} {'(new)':>9}")
+            continue
+        changes = {
+            metric: (result[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            for metric in ("rps", "p50_ms", "p99_ms")
+        }
+        regressed = max_regression is not None and (
+            -changes["rps"] > max_regression or changes["p99_ms"] > max_regression
+        )
+        ok = ok and not regressed
+        print(f"{name:<32} {changes['rps']:>+9.1%} {changes['p50_ms']:>+9.1%} {changes['p99_ms']:>+9.1%}"
+              + ("  REGRESSION" if regressed else ""))
+    return ok
+
+async def run(args, backend_url: str, stub_url: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=args.timeout) as client:
+        if NEEDS_MODEL & set(args.scenarios):
+            print(f"training models for {args.users} users...")
+            await train_users(client, args.users)
+        print(f"{'scenario':<32} {'requests':>9} {'rps':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>7} {'upstream':>9}")
+        for name in args.scenarios:
+            result = await run_scenario(
+                client, SCENARIOS[name], args.concurrency, args.duration, args.warmup, args.users, stub_url
+            )
+            results[name] = result
+            upstream = result["upstream_per_request"]
+            print(f"{name:<32} {result['requests']:>9} {result['rps']:>9.1f} {result['p50_ms']:>9.1f} "
+                  f"{result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['errors']:>7} "
+                  f"{'-' if upstream is None else f'{upstream:.2f}':>9}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per scenario")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each scenario")
+    parser.add_argument("--users", type=int, default=8, help="distinct bearer tokens the clients rotate through")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--target", help="URL of an already running backend (skips starting servers)")
+    parser.add_argument("--stub-url", help="stub used by --target, for upstream request counts")
+    parser.add_argument("--port", type=int, default=8901, help="port for the spawned backend")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=30.0, help="stub latency per request (ms)")
+    parser.add_argument("--jitter", type=float, default=10.0, help="stub latency standard deviation (ms)")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of stub responses that are 429s")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="keep the backend's outbound SPOTIFY_*_RATE limits instead of lifting them")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare against, if the file exists")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store these results as a baseline")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit non-zero if RPS drops or p99 grows by more than this fraction")
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if args.target:
+            urls = {"backend": args.target, "stub": args.stub_url}
+        else:
+            urls = start_servers(stack, args)
+        results = asyncio.run(run(args, urls["backend"], urls["stub"]))
+
+    ok = True
+    if args.baseline and os.path.exists(args.baseline) and args.baseline != args.save_baseline:
+        with open(args.baseline) as f:
+            ok = compare(results, json.load(f), args.max_regression)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        config = {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline")}
+        with open(args.save_baseline, "w") as f:
+            json.dump({"recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"), "config": config, "results": results}, f, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Local stand-in for the Spotify Web API and accounts service, for load tests.
+
+Serves deterministic canned data for the endpoints the backend calls, with
+configurable response latency and injected 429s. Point the backend at it with
+SPOTIFY_API_BASE_URL=http://127.0.0.1:<port>/v1 and
+SPOTIFY_TOKEN_URL=http://127.0.0.1:<port>/api/token. Any bearer token is
+accepted and maps to a stable fake user.
+
+    python -m benchmarks.spotify_stub --port 8900 --latency 30 --rate-limit-ratio 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+GENRES = ["pop", "rock", "hip hop", "indie", "electronic", "jazz", "classical", "r&b", "metal", "folk"]
+MARKETS = ["US", "GB", "DE", "FR", "SE", "BR", "JP", "AU", "CA", "MX", "ES", "IT", "NL", "IN", "KR"]
+FEATURE_RANGES = {
+    "danceability": (0, 1), "energy": (0, 1), "loudness": (-30, 0), "speechiness": (0, 1),
+    "acousticness": (0, 1), "instrumentalness": (0, 1), "liveness": (0, 1), "valence": (0, 1),
+    "tempo": (60, 200),
+}
+PLAYLISTS_PER_USER = 5
+PLAYLIST_LENGTH = 200
+SAVED_TRACKS = 300
+
+def track_id(i: int) -> str:
+    return f"stubtrack{i:013d}"
+
+def artist_id(i: int) -> str:
+    return f"stubartist{i:012d}"
+
+def make_track(i: int) -> Dict[str, Any]:
+    """A track object shaped like Spotify's full track, including its bulky fields"""
+    artist = i % 500
+    album = i // 10
+    return {
+        "id": track_id(i),
+        "name": f"Track {i}",
+        "uri": f"spotify:track:{track_id(i)}",
+        "href": f"https://api.spotify.com/v1/tracks/{track_id(i)}",
+        "type": "track",
+        "duration_ms": 120_000 + (i * 7919) % 240_000,
+        "popularity": (i * 31) % 100,
+        "explicit": i % 7 == 0,
+        "preview_url": None,
+        "is_local": False,
+        "disc_number": 1,
+        "track_number": i % 10 + 1,
+        "available_markets": MARKETS,
+        "external_ids": {"isrc": f"STUB{i:08d}"},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id(i)}"},
+        "artists": [{
+            "id": artist_id(artist),
+            "name": f"Artist {artist}",
+            "type": "artist",
+            "uri": f"spotify:artist:{artist_id(artist)}",
+        }],
+        "album": {
+            "id": f"stubalbum{album:013d}",
+            "name": f"Album {album}",
+            "type": "album",
+            "album_type": "album",
+            "release_date": f"{1970 + album % 55}-01-01",
+            "total_tracks": 10,
+            "available_markets": MARKETS,
+            "images": [
+                {"url": f"https://i.scdn.co/image/stub{album}-{size}", "height": size, "width": size}
+                for size in (640, 300, 64)
+            ],
+        },
+    }
+
+def make_audio_features(i: int) -> Dict[str, Any]:
+    rng = random.Random(i)
+    features = {name: low + (high - low) * rng.random() for name, (low, high) in FEATURE_RANGES.items()}
+    return {
+        **features,
+        "id": track_id(i),
+        "key": rng.randrange(12),
+        "mode": rng.randrange(2),
+        "time_signature": 4,
+        "duration_ms": 120_000 + (i * 7919) % 240_000,
+        "type": "audio_features",
+        "uri": f"spotify:track:{track_id(i)}",
+    }
+
+def make_artist(i: int) -> Dict[str, Any]:
+    return {
+        "id": artist_id(i),
+        "name": f"Artist {i}",
+        "type": "artist",
+        "uri": f"spotify:artist:{artist_id(i)}",
+        "genres": [GENRES[i % len(GENRES)], GENRES[(i * 3 + 1) % len(GENRES)]],
+        "popularity": (i * 17) % 100,
+        "followers": {"href": None, "total": i * 1000},
+        "images": [{"url": f"https://i.scdn.co/image/artist{i}", "height": 640, "width": 640}],
+    }
+
+def error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse({"error": {"status": status, "message": message}}, status_code=status, headers=headers)
+
+def create_app(
+    catalogue_size: int = 5000,
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    rate_limit_ratio: float = 0.0,
+    retry_after: int = 1,
+    seed: int = 0
+) -> FastAPI:
+    """Build the stub app; the catalogue is generated once up front"""
+    tracks = [make_track(i) for i in range(catalogue_size)]
+    features = {track_id(i): make_audio_features(i) for i in range(catalogue_size)}
+    index = {track["id"]: i for i, track in enumerate(tracks)}
+    artists = [make_artist(i) for i in range(500)]
+    rng = random.Random(seed)
+    requests = Counter()
+
+    app = FastAPI()
+
+    def user_offset(request: Request, salt: str = "") -> int:
+        token = request.headers.get("Authorization", "")
+        return int(hashlib.sha256(f"{token}{salt}".encode()).hexdigest()[:8], 16)
+
+    def tracks_for(request: Request, salt: str, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        start = user_offset(request, salt) + offset
+        return [tracks[(start + i) % catalogue_size] for i in range(limit)]
+
+    def page(request: Request, items: List[Any], limit: int, offset: int, total: int) -> Dict[str, Any]:
+        next_url = None
+        if offset + limit < total:
+            next_url = str(request.url.include_query_params(offset=offset + limit, limit=limit))
+        return {"items": items, "limit": limit, "offset": offset, "total": total, "next": next_url}
+
+    @app.middleware("http")
+    async def simulate_upstream(request: Request, call_next):
+        requests[f"{request.method} {request.url.path}"] += 1
+        if latency_ms or jitter_ms:
+            await asyncio.sleep(max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000)
+        if not request.url.path.startswith("/stub") and rng.random() < rate_limit_ratio:
+            requests["429"] += 1
+            return error(429, "API rate limit exceeded", {"Retry-After": str(retry_after)})
+        if request.url.path.startswith("/v1") and not request.headers.get("Authorization", "").startswith("Bearer "):
+            return error(401, "No token provided")
+        return await call_next(request)
+
+    @app.get("/stub/stats")
+    async def stats():
+        """Requests received per method and path, and how many were answered 429"""
+        return dict(requests)
+
+    @app.post("/api/token")
+    async def token():
+        return {
+            "access_token": f"stub-{uuid.uuid4().hex}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": f"stub-refresh-{uuid.uuid4().hex}",
+            "scope": "user-top-read user-read-recently-played",
+        }
+
+    @app.get("/v1/me")
+    async def me(request: Request):
+        user_id = f"stubuser{user_offset(request):010d}"
+        return {"id": user_id, "display_name": user_id, "country": "US", "product": "premium", "type": "user"}
+
+    @app.get("/v1/me/top/tracks")
+    async def top_tracks(request: Request, time_range: str = "medium_term", limit: int = 20, offset: int = 0):
+        return page(request, tracks_for(request, time_range, limit, offset), limit, offset, 50)
+
+    @app.get("/v1/me/top/artists")
+    async def top_artists(request: Request, time_range: str = "medium_term", limit: int = 20, offset: int = 0):
+        start = user_offset(request, time_range) + offset
+        items = [artists[(start + i) % len(artists)] for i in range(limit)]
+        return page(request, items, limit, offset, 50)
+
+    @app.get("/v1/me/player/recently-played")
+    async def recently_played(request: Request, limit: int = 20):
+        items = [
+            {"track": track, "played_at": f"2024-01-01T00:{i % 60:02d}:00Z", "context": None}
+            for i, track in enumerate(tracks_for(request, "recent", limit))
+        ]
+        return {"items": items, "limit": limit, "next": None, "cursors": None}
+
+    @app.get("/v1/audio-features")
+    async def audio_features(ids: str):
+        requested = ids.split(",")
+        if len(requested) > 100:
+            return error(400, "Too many ids requested")
+        return {"audio_features": [features.get(i) for i in requested]}
+
+    @app.get("/v1/tracks/{id}")
+    async def track(id: str):
+        if id not in index:
+            return error(404, "Non existing id")
+        return tracks[index[id]]
+
+    @app.get("/v1/recommendations")
+    async def recommendations(limit: int = 20, seed_tracks: str = "", seed_artists: str = "", market: Optional[str] = None):
+        seeds = [seed for seed in seed_tracks.split(",") if seed]
+        if not seeds and not seed_artists:
+            return error(400, "No seeds provided")
+        if market is not None and not (len(market) == 2 and market.isalpha()):
+            return error(400, "Invalid market code")
+        # Like Spotify, an unknown seed is a 400 here; GET /tracks/{id} answers 404
+        if any(seed not in index for seed in seeds):
+            return error(400, "invalid request")
+        start = sum(index[seed] for seed in seeds) * 7
+        return {
+            "tracks": [tracks[(start + i) % catalogue_size] for i in range(1, limit + 1)],
+            "seeds": [
+                {"id": seed, "type": "TRACK", "initialPoolSize": 250, "afterFilteringSize": 250, "afterRelinkingSize": 250}
+                for seed in seeds
+            ],
+        }
+
+    @app.get("/v1/search")
+    async def search(request: Request, q: str, type: str = "track", limit: int = 20, offset: int = 0):
+        # "Track 123" finds track 123; any other query maps to a stable pseudo-random track
+        digits = "".join(ch for ch in q if ch.isdigit())
+        start = int(digits) if digits else int(hashlib.sha256(q.encode()).hexdigest()[:8], 16)
+        items = [tracks[(start + offset + i) % catalogue_size] for i in range(limit)]
+        return {"tracks": page(request, items, limit, offset, 1000)}
+
+    @app.get("/v1/me/playlists")
+    async def playlists(request: Request, limit: int = 20, offset: int = 0):
+        owner = user_offset(request)
+        items = [
+            {"id": f"stubplaylist{owner % 10 ** 6:06d}{i:04d}", "name": f"Playlist {i}", "tracks": {"total": PLAYLIST_LENGTH}}
+            for i in range(offset, min(offset + limit, PLAYLISTS_PER_USER))
+        ]
+        return page(request, items, limit, offset, PLAYLISTS_PER_USER)
+
+    @app.get("/v1/playlists/{playlist_id}")
+    async def playlist(playlist_id: str):
+        return {"id": playlist_id, "name": f"Playlist {playlist_id[-4:]}", "tracks": {"total": PLAYLIST_LENGTH}}
+
+    @app.get("/v1/playlists/{playlist_id}/tracks")
+    async def playlist_tracks(request: Request, playlist_id: str, limit: int = 100, offset: int = 0):
+        limit = min(limit, max(0, PLAYLIST_LENGTH - offset))
+        items = [{"track": track, "is_local": False} for track in tracks_for(request, playlist_id, limit, offset)]
+        return page(request, items, limit, offset, PLAYLIST_LENGTH)
+
+    @app.post("/v1/playlists/{playlist_id}/tracks")
+    async def add_playlist_tracks(playlist_id: str, request: Request):
+        body = await request.json()
+        if len(body.get("uris", [])) > 100:
+            return error(400, "Too many tracks requested")
+        return JSONResponse({"snapshot_id": uuid.uuid4().hex}, status_code=201)
+
+    @app.get("/v1/me/tracks")
+    async def saved_tracks(request: Request, limit: int = 20, offset: int = 0):
+        limit = min(limit, max(0, SAVED_TRACKS - offset))
+        items = [{"added_at": "2024-01-01T00:00:00Z", "track": track} for track in tracks_for(request, "saved", limit, offset)]
+        return page(request, items, limit, offset, SAVED_TRACKS)
+
+    @app.put("/v1/me/tracks")
+    async def save_tracks(request: Request):
+        body = await request.json()
+        if len(body.get("ids", [])) > 50:
+            return error(400, "Too many ids requested")
+        return Response(status_code=200)
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--catalogue", type=int, default=5000, help="number of distinct tracks")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added latency per request (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the added latency (ms)")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.catalogue, args.latency, args.jitter, args.rate_limit_ratio, args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.spotify_auth import get_current_user
+
+def post_batch(body):
+    app.dependency_overrides[get_current_user] = lambda: {"id": "batch-test-user", "access_token": "token"}
+    try:
+        return TestClient(app).post("/ml/recommendations/batch", json=body)
+    finally:
+        app.dependency_overrides.pop(get_current_user)
+
+def test_too_many_seeds_is_rejected():
+    response = post_batch({"track_ids": [f"t{i}" for i in range(101)]})
+    assert response.status_code == 422
+
+def test_too_many_recommendations_is_rejected():
+    response = post_batch({"track_ids": ["t1"], "n_recommendations": 1000})
+    assert response.status_code == 422
+
+def test_empty_batch_is_rejected():
+    response = post_batch({"track_ids": []})
+    assert response.status_code == 422
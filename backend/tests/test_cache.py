@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.cache import TTLCache
+
+def test_follower_loads_itself_when_the_leader_is_cancelled():
+    async def run():
+        cache = TTLCache()
+        started = asyncio.Event()
+
+        async def slow_loader():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def loader():
+            return "value"
+
+        leader = asyncio.create_task(cache.get_or_load("key", slow_loader))
+        await started.wait()
+        follower = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(run()) == ("value", True)
+
+def test_follower_gets_the_leaders_error():
+    async def run():
+        cache = TTLCache()
+        started = asyncio.Event()
+
+        async def failing_loader():
+            started.set()
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        leader = asyncio.create_task(cache.get_or_load("key", failing_loader))
+        await started.wait()
+        follower = asyncio.create_task(cache.get_or_load("key", failing_loader))
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return [repr(result) for result in results]
+
+    assert asyncio.run(run()) == ["ValueError('upstream failed')"] * 2
+
+def test_cancelled_follower_does_not_cancel_the_load():
+    async def run():
+        cache = TTLCache()
+        started = asyncio.Event()
+
+        async def loader():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "value"
+
+        leader = asyncio.create_task(cache.get_or_load("key", loader))
+        await started.wait()
+        follower = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader, cache.get("key")
+
+    assert asyncio.run(run()) == ("value", "value")
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.ml_model import MusicRecommender, load_model, save_model
+
+def make_tracks(n: int = 60) -> pd.DataFrame:
+    """Tracks with an id and the audio feature columns only"""
+    rng = np.random.default_rng(0)
+    recommender = MusicRecommender()
+    df = pd.DataFrame(rng.random((n, len(recommender.feature_columns))), columns=recommender.feature_columns)
+    df["key"] = rng.integers(0, 12, n)
+    df["mode"] = rng.integers(0, 2, n)
+    df.insert(0, "id", [f"t{i}" for i in range(n)])
+    return df
+
+def test_round_trip_without_metadata_columns(tmp_path):
+    recommender = MusicRecommender()
+    recommender.train_model(make_tracks(), n_clusters=3)
+    before = recommender.get_recommendations("t1", n_recommendations=5, exact=True)
+    batch_before = recommender.get_batch_recommendations(["t1"], n_recommendations=5, exact=True)
+
+    path = os.path.join(tmp_path, "model.joblib")
+    save_model(recommender, path)
+    loaded = load_model(path)
+
+    after = loaded.get_recommendations("t1", n_recommendations=5, exact=True)
+    assert len(before) == 5
+    assert [track["id"] for track in after] == [track["id"] for track in before]
+    assert after[0].keys() == before[0].keys()
+    assert after[0]["key"] == before[0]["key"]
+    batch_after = loaded.get_batch_recommendations(["t1"], n_recommendations=5, exact=True)
+    assert [track["id"] for track in batch_after["t1"]] == [track["id"] for track in batch_before["t1"]]
@@ -0,0 +1,28 @@
+import asyncio
+
+import httpx
+
+from app import spotify_client
+from app.routers.recommendations import get_similar_tracks
+from benchmarks.spotify_stub import create_app, track_id
+
+def similar_tracks(**params):
+    async def run():
+        spotify_client._http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(catalogue_size=50)))
+        try:
+            return await get_similar_tracks(current_user={"access_token": "token"}, **{"limit": 5, "market": None, **params})
+        finally:
+            await spotify_client.close_http_client()
+    return asyncio.run(run())
+
+def test_known_seed_returns_recommendations():
+    result = similar_tracks(track_id=track_id(1))
+    assert len(result["tracks"]) == 5
+
+def test_unknown_seed_is_not_found():
+    result = similar_tracks(track_id="doesnotexist")
+    assert result == {"error": {"status": 404, "message": "Track not found: doesnotexist"}}
+
+def test_bad_market_passes_spotify_message_through():
+    result = similar_tracks(track_id=track_id(2), market="XYZ")
+    assert result == {"error": {"status": 400, "message": "Invalid market code"}}
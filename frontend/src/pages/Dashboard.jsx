@@ -27,26 +27,17 @@ const Dashboard = () => {
       
       try {
         setLoading(true);
-        const [tracksResponse, artistsResponse, recentResponse] = await Promise.all([
-          axios.get(`${import.meta.env.VITE_API_URL}/analysis/top-tracks?time_range=${timeRange}`, {
-            headers: { 'Authorization': `Bearer ${accessToken}` }
-          }),
-          axios.get(`${import.meta.env.VITE_API_URL}/analysis/top-artists?time_range=${timeRange}`, {
-            headers: { 'Authorization': `Bearer ${accessToken}` }
-          }),
-          axios.get(`${import.meta.env.VITE_API_URL}/analysis/recently-played`, {
-            headers: { 'Authorization': `Bearer ${accessToken}` }
-          })
-        ]);
+        // One request: the backend fans out to Spotify and enriches every section together
+        const response = await axios.get(`${import.meta.env.VITE_API_URL}/analysis/dashboard?time_range=${timeRange}`, {
+          headers: { 'Authorization': `Bearer ${accessToken}` }
+        });
 
         setStats({
-          tracks: tracksResponse.data,
-          artists: artistsResponse.data
+          tracks: response.data.top_tracks,
+          artists: response.data.top_artists
         });
-        setRecentlyPlayed(recentResponse.data);
-
-        const preferences = calculateMusicPreferences(tracksResponse.data);
-        setMusicPreferences(preferences);
+        setRecentlyPlayed(response.data.recently_played);
+        setMusicPreferences(response.data.aggregates.feature_profile);
       } catch (error) {
         console.error('Error fetching dashboard data:', error);
       } finally {
@@ -57,22 +48,6 @@ const Dashboard = () => {
     initializeDashboard();
   }, [user, accessToken, navigate, timeRange]);
 
-  const calculateMusicPreferences = (tracks) => {
-    const features = tracks.reduce((acc, track) => {
-      Object.keys(track.audio_features).forEach(key => {
-        if (!acc[key]) acc[key] = 0;
-        acc[key] += track.audio_features[key];
-      });
-      return acc;
-    }, {});
-
-    Object.keys(features).forEach(key => {
-      features[key] = features[key] / tracks.length;
-    });
-
-    return features;
-  };
-
   const radarChartData = {
     labels: ['Danceability', 'Energy', 'Valence', 'Acousticness', 'Instrumentalness', 'Liveness'],
     datasets: [